@@ -0,0 +1,183 @@
+import asyncio
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Conversations idle this long have their messages moved to the archive; 0 disables archiving
+MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get("MESSAGE_ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_INTERVAL = float(os.environ.get("MESSAGE_ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_CHUNK_MESSAGES = int(os.environ.get("MESSAGE_ARCHIVE_CHUNK_MESSAGES", "1000"))
+ARCHIVE_BATCH_CONVERSATIONS = 100
+
+
+def compress(messages: List[Dict[str, Any]]) -> bytes:
+    return zlib.compress(json.dumps(messages, separators=(",", ":"), default=str).encode("utf-8"), 6)
+
+
+def decompress(data: bytes) -> List[Dict[str, Any]]:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def chunk_doc(conversation: Dict[str, Any], messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """message_archive document for consecutive messages of one conversation.
+
+    The id is derived from the first message, so archiving the same messages twice
+    (a replica that died between writing the chunk and deleting the hot copies)
+    rewrites the same chunk instead of adding a second one.
+    """
+    return {
+        "id": f"{conversation['id']}:{messages[0]['id']}",
+        "conversation_id": conversation["id"],
+        "tenant_id": conversation.get("tenant_id"),
+        "first_timestamp": messages[0].get("timestamp"),
+        "last_timestamp": messages[-1].get("timestamp"),
+        "count": len(messages),
+        "data": compress(messages),
+        "archived_at": datetime.now(timezone.utc),
+    }
+
+
+def unique_by_id(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Drop repeats of a message id, which an archival run interrupted while rewriting chunks can leave behind"""
+    seen = set()
+    unique = []
+    for message in messages:
+        if message.get("id") not in seen:
+            seen.add(message.get("id"))
+            unique.append(message)
+    return unique
+
+
+async def archived_messages(db, conversation_ids: List[str]) -> List[Dict[str, Any]]:
+    """Archived messages of the given conversations, in (conversation_id, timestamp) order"""
+    messages = []
+    cursor = db.message_archive.find(
+        {"conversation_id": {"$in": conversation_ids}}, {"_id": 0, "data": 1}
+    ).sort([("conversation_id", 1), ("first_timestamp", 1)])
+    async for chunk in cursor:
+        messages.extend(decompress(chunk["data"]))
+    return sorted(unique_by_id(messages), key=lambda message: (message.get("conversation_id", ""), message.get("timestamp") or ""))
+
+
+async def conversation_messages(db, conversation: Dict[str, Any], limit: int = 1000) -> List[Dict[str, Any]]:
+    """A conversation's first limit messages in timestamp order, archived ones included.
+
+    Only conversations the archiver has touched (archived_count) cost the extra reads.
+    Chunk counts are read first so only the chunks holding the earliest limit archived
+    messages are fetched and decompressed; a message present in both tiers (archival
+    interrupted half-way) is returned once.
+    """
+    hot = await db.messages.find({"conversation_id": conversation["id"]}, {"_id": 0}).sort("timestamp", 1).to_list(limit)
+    if not conversation.get("archived_count"):
+        return hot
+
+    chunk_ids, needed = [], limit
+    chunks = db.message_archive.find(
+        {"conversation_id": conversation["id"]}, {"_id": 0, "id": 1, "count": 1}
+    ).sort("first_timestamp", 1)
+    async for chunk in chunks:
+        chunk_ids.append(chunk["id"])
+        needed -= chunk["count"]
+        if needed <= 0:
+            break
+    cold = []
+    async for chunk in db.message_archive.find({"id": {"$in": chunk_ids}}, {"_id": 0, "data": 1}):
+        cold.extend(decompress(chunk["data"]))
+
+    cold = unique_by_id(cold)
+    cold_ids = {message.get("id") for message in cold}
+    merged = cold + [message for message in hot if message.get("id") not in cold_ids]
+    return sorted(merged, key=lambda message: message.get("timestamp") or "")[:limit]
+
+
+class MessageArchiver:
+    """Moves the messages of idle conversations into message_archive.
+
+    Each conversation's messages become zlib-compressed JSON chunks of up to
+    ARCHIVE_CHUNK_MESSAGES, which keeps the hot messages collection (and its indexes)
+    down to recent traffic. Conversations are picked by the (cold, updated_at) index:
+    a conversation is marked cold once archived, and hot writes set cold back to
+    False, so a conversation that wakes up is archived again when it next goes idle.
+    Hot copies are only deleted by id once their chunk is written. Chunks an
+    interrupted run left overlapping the hot messages are merged into the new ones,
+    so each archived message ends up in a single chunk.
+    """
+
+    def __init__(self, db, after_days: int = MESSAGE_ARCHIVE_AFTER_DAYS):
+        self.db = db
+        self.after_days = after_days
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.after_days > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                archived = await self.archive_idle()
+                if archived:
+                    logger.info(f"Archived {archived} messages")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Message archival error: {str(e)}")
+            await asyncio.sleep(ARCHIVE_INTERVAL)
+
+    async def archive_idle(self, now: Optional[datetime] = None) -> int:
+        """Archive every conversation idle for after_days; returns the number of messages moved"""
+        cutoff = ((now or datetime.now(timezone.utc)) - timedelta(days=self.after_days)).isoformat()
+        archived = 0
+        while True:
+            conversations = await self.db.conversations.find(
+                {"cold": {"$in": [None, False]}, "updated_at": {"$lt": cutoff}},
+                {"_id": 0, "id": 1, "tenant_id": 1, "updated_at": 1}
+            ).limit(ARCHIVE_BATCH_CONVERSATIONS).to_list(ARCHIVE_BATCH_CONVERSATIONS)
+            if not conversations:
+                return archived
+            for conversation in conversations:
+                archived += await self.archive_conversation(conversation)
+
+    async def archive_conversation(self, conversation: Dict[str, Any]) -> int:
+        from pymongo import ReplaceOne
+
+        messages = await self.db.messages.find(
+            {"conversation_id": conversation["id"]}, {"_id": 0}
+        ).sort("timestamp", 1).to_list(None)
+        archiving = messages
+        overlapping = []
+        if messages:
+            # Chunks written by a run that died before deleting every hot copy reach into these messages
+            overlapping = await self.db.message_archive.find(
+                {"conversation_id": conversation["id"], "last_timestamp": {"$gte": messages[0]["timestamp"]}},
+                {"_id": 0, "id": 1, "data": 1}
+            ).to_list(None)
+        if overlapping:
+            archived = [message for chunk in overlapping for message in decompress(chunk["data"])]
+            archiving = sorted(unique_by_id(messages + archived), key=lambda message: message.get("timestamp") or "")
+        chunks = [archiving[i:i + ARCHIVE_CHUNK_MESSAGES] for i in range(0, len(archiving), ARCHIVE_CHUNK_MESSAGES)]
+        if chunks:
+            docs = [chunk_doc(conversation, chunk) for chunk in chunks]
+            await self.db.message_archive.bulk_write([ReplaceOne({"id": doc["id"]}, doc, upsert=True) for doc in docs], ordered=False)
+            replaced = [chunk["id"] for chunk in overlapping if chunk["id"] not in {doc["id"] for doc in docs}]
+            if replaced:
+                await self.db.message_archive.delete_many({"id": {"$in": replaced}})
+            # Readers look in the archive once archived_count is set, so set it before the hot copies go
+            await self.db.conversations.update_one({"id": conversation["id"]}, {"$inc": {"archived_count": len(messages)}})
+            await self.db.messages.delete_many({"id": {"$in": [message["id"] for message in messages]}})
+        # Only mark it cold if nothing was written to it meanwhile
+        await self.db.conversations.update_one(
+            {"id": conversation["id"], "updated_at": conversation["updated_at"]}, {"$set": {"cold": True}}
+        )
+        return len(messages)
@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "1000"))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BULK_WRITE_CHUNK = 500
+
+
+def item_error(field: str, index: int, msg: str, item_field: Optional[str] = None) -> Dict[str, Any]:
+    """A validation error for one batch item, shaped like FastAPI's own 422 errors"""
+    loc = ["body", field, index] + ([item_field] if item_field else [])
+    return {"loc": loc, "msg": msg, "type": "value_error"}
+
+
+def check_size(field: str, items: List[Any]) -> List[Dict[str, Any]]:
+    if not items:
+        return [{"loc": ["body", field], "msg": "Batch is empty", "type": "value_error"}]
+    if len(items) > BATCH_MAX_ITEMS:
+        return [{"loc": ["body", field], "msg": f"At most {BATCH_MAX_ITEMS} items per batch", "type": "value_error"}]
+    return []
+
+
+def check_unique(
+    field: str, keys: List[Tuple[int, Optional[Hashable]]], item_field: Optional[str] = None, label: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Errors for items repeating an earlier item's key (None keys are ignored)"""
+    errors, seen = [], {}
+    for index, key in keys:
+        if key is None:
+            continue
+        if key in seen:
+            errors.append(item_error(field, index, f"Same {label or item_field or 'value'} as item {seen[key]}", item_field))
+        else:
+            seen[key] = index
+    return errors
+
+
+async def bulk_write_chunks(collection, operations: List[Tuple[int, Any]]) -> Dict[int, str]:
+    """Run (item index, write operation) pairs as unordered bulk_writes.
+
+    Operations go in chunks of BULK_WRITE_CHUNK with at most BATCH_CONCURRENCY chunks
+    in flight. Returns the error message of each item whose write failed.
+    """
+    from pymongo.errors import BulkWriteError
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    errors: Dict[int, str] = {}
+
+    async def run(chunk: List[Tuple[int, Any]]):
+        async with semaphore:
+            try:
+                await collection.bulk_write([operation for _, operation in chunk], ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    errors[chunk[error["index"]][0]] = error.get("errmsg", "Write failed")
+
+    await asyncio.gather(*(run(operations[i:i + BULK_WRITE_CHUNK]) for i in range(0, len(operations), BULK_WRITE_CHUNK)))
+    return errors
+
+
+def item_results(indexes: List[int], statuses: Dict[int, Dict[str, Any]], errors: Dict[int, str]) -> Dict[str, Any]:
+    """Per-item results in request order, with counts"""
+    results = []
+    for index in indexes:
+        if index in errors:
+            results.append({"index": index, "status": "error", "error": errors[index]})
+        else:
+            results.append({"index": index, **statuses[index]})
+    failed = sum(1 for result in results if result["status"] == "error")
+    return {"succeeded": len(results) - failed, "failed": failed, "results": results}
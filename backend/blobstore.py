@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import os
+import re
+from typing import Any, AsyncIterator, Dict, Optional
+
+from lazy import LazyObject
+from starlette.responses import Response, StreamingResponse
+
+logger = logging.getLogger(__name__)
+
+BLOB_CHUNK_BYTES = 255 * 1024  # GridFS default chunk size
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class BlobStore:
+    """Content-addressed binary storage in GridFS.
+
+    Blobs are stored under their SHA-256, which is only known once the content has
+    been read, so an upload streams into a GridFS file under a temporary name while
+    hashing, then claims the hash as its filename. A unique index on filename means
+    identical content is kept once: if the hash is already taken (by an earlier
+    upload or a concurrent one) the new copy is deleted instead.
+
+    Each blob records the kinds of use it was stored for ("media", "logo"), so a
+    public route can refuse to serve content that was only ever uploaded privately.
+    """
+
+    def __init__(self, db, bucket: str = "blobs"):
+        self.db = db
+        self.bucket_name = bucket
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            database = self.db._resolve() if isinstance(self.db, LazyObject) else self.db
+            self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name=self.bucket_name)
+        return self._bucket
+
+    @property
+    def files(self):
+        return self.db[f"{self.bucket_name}.files"]
+
+    async def find(self, sha256: str) -> Optional[Dict[str, Any]]:
+        return await self.files.find_one({"filename": sha256})
+
+    async def add_kind(self, sha256: str, kind: str):
+        await self.files.update_one({"filename": sha256}, {"$addToSet": {"metadata.kinds": kind}})
+
+    async def put_stream(self, chunks: AsyncIterator[bytes], content_type: str, kind: str) -> Dict[str, Any]:
+        """Store streamed content; returns its sha256, size and content type. Memory use is one chunk."""
+        from pymongo.errors import DuplicateKeyError
+
+        digest = hashlib.sha256()
+        size = 0
+        upload = self.bucket.open_upload_stream(
+            f"pending-{os.urandom(8).hex()}", metadata={"content_type": content_type, "kinds": [kind]}
+        )
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await upload.write(chunk)
+            await upload.close()
+        except BaseException:
+            await upload.abort()
+            raise
+
+        sha256 = digest.hexdigest()
+        try:
+            await self.bucket.rename(upload._id, sha256)
+        except DuplicateKeyError:
+            # Already stored: keep the existing copy
+            await self.bucket.delete(upload._id)
+            await self.add_kind(sha256, kind)
+        return {"sha256": sha256, "size": size, "content_type": content_type}
+
+    async def put_bytes(self, data: bytes, content_type: str, kind: str) -> Dict[str, Any]:
+        """Store content already in memory, skipping the upload when the hash is already stored"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        if await self.find(sha256):
+            await self.add_kind(sha256, kind)
+        else:
+            async def single():
+                yield data
+            await self.put_stream(single(), content_type, kind)
+        return {"sha256": sha256, "size": len(data), "content_type": content_type}
+
+    async def response(
+        self, sha256: str, range_header: Optional[str], if_none_match: Optional[str], cache_control: str, kind: Optional[str] = None
+    ) -> Response:
+        """Serve a blob with ETag revalidation and single byte-range requests; with kind, only blobs stored for that use"""
+        file = await self.find(sha256)
+        if not file or (kind and kind not in (file.get("metadata") or {}).get("kinds", [])):
+            return Response(status_code=404)
+        etag = f'"{sha256}"'
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+        content_type = (file.get("metadata") or {}).get("content_type", "application/octet-stream")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        length = file["length"]
+        start, end, status = 0, length - 1, 200
+        match = RANGE.match(range_header or "")
+        if match and (match.group(1) or match.group(2)):
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), length - 1) if match.group(2) else length - 1
+            else:
+                # suffix range: the last n bytes
+                start = max(0, length - int(match.group(2)))
+            if start >= length or start > end:
+                return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+        headers["Content-Length"] = str(end - start + 1)
+
+        download = await self.bucket.open_download_stream(file["_id"])
+        download.seek(start)
+
+        async def body():
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await download.read(min(BLOB_CHUNK_BYTES, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+        return StreamingResponse(body(), status_code=status, media_type=content_type, headers=headers)
@@ -0,0 +1,108 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from outbox import Outbox
+from scheduler import INSTANCE_ID, SCHEDULER_LEASE, iso
+from template_compiler import CompiledTemplate, compile_template
+
+logger = logging.getLogger(__name__)
+
+CAMPAIGN_BATCH_SIZE = int(os.environ.get("CAMPAIGN_BATCH_SIZE", "500"))
+
+
+async def load_template(db, campaign: Dict[str, Any]) -> Optional[CompiledTemplate]:
+    """Compiled render plan for the campaign's template, or None for a plain text campaign"""
+    if not campaign.get("template_id"):
+        return None
+    template = await db.templates.find_one({"id": campaign["template_id"], "tenant_id": campaign["tenant_id"]}, {"_id": 0})
+    return compile_template(template) if template else None
+
+
+def build_payloads(template: Optional[CompiledTemplate], campaign: Dict[str, Any], contacts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Graph API message bodies for a batch of recipients: the rendered template if there is one, else plain text"""
+    if template:
+        return template.render_batch(contacts)
+    payload = {"type": "text", "text": {"body": campaign["message_template"]}}
+    return [payload] * len(contacts)
+
+
+def audience_query(tenant_id: str, audience: Dict[str, Any]) -> Dict[str, Any]:
+    """Contacts filter for an audience segment; served by the multikey (tenant_id, tags) index"""
+    query = {"tenant_id": tenant_id}
+    tags = audience.get("tags") or []
+    if tags:
+        query["tags"] = {"$all": tags} if audience.get("match") == "all" else {"$in": tags}
+    if audience.get("opted_in_only", True):
+        query["opted_in"] = True
+    return query
+
+
+async def recipient_batches(db, campaign: Dict[str, Any], fields: List[str] = ()) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Yield the campaign's recipients in batches straight off a Mongo cursor.
+
+    Only phone_number and the given contact fields (what the template renders) are fetched.
+
+    Audiences are resolved here, at send time, so neither the campaign document nor
+    this process ever holds the whole list.
+    """
+    projection = {"_id": 0, "phone_number": 1, **{field: 1 for field in fields}}
+    if campaign.get("audience") is not None:
+        cursor = db.contacts.find(
+            audience_query(campaign["tenant_id"], campaign["audience"]), projection
+        ).batch_size(CAMPAIGN_BATCH_SIZE)
+        batch = []
+        async for contact in cursor:
+            batch.append(contact)
+            if len(batch) >= CAMPAIGN_BATCH_SIZE:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+        return
+
+    # Campaigns created with an explicit list of contact ids
+    contact_ids = campaign.get("target_contacts", [])
+    for i in range(0, len(contact_ids), CAMPAIGN_BATCH_SIZE):
+        contacts = await db.contacts.find(
+            {"tenant_id": campaign["tenant_id"], "id": {"$in": contact_ids[i:i + CAMPAIGN_BATCH_SIZE]}, "opted_in": {"$ne": False}},
+            projection
+        ).to_list(CAMPAIGN_BATCH_SIZE)
+        yield contacts
+
+
+async def run_campaign(db, outbox: Outbox, campaign: Dict[str, Any]):
+    """Queue a campaign's messages in the outbox in batches.
+
+    Outbox idempotency keys are per (campaign, recipient), so a run taken over from
+    a replica that died part-way only queues the recipients it hadn't reached. Each
+    batch renews this replica's lease and adds to sent_count in the same update.
+    """
+    template = await load_template(db, campaign)
+    queued = 0
+
+    async for contacts in recipient_batches(db, campaign, template.fields if template else []):
+        payloads = build_payloads(template, campaign, contacts)
+        docs = [
+            Outbox.build(
+                campaign["tenant_id"], contact["phone_number"], payload,
+                idempotency_key=f"campaign:{campaign['id']}:{contact['phone_number']}", campaign_id=campaign["id"]
+            )
+            for contact, payload in zip(contacts, payloads)
+        ]
+        inserted = await outbox.enqueue_many(docs)
+        queued += inserted
+        result = await db.campaigns.update_one(
+            {"id": campaign["id"], "status": "running", "lease_owner": INSTANCE_ID},
+            {"$set": {"lease_expires_at": iso(datetime.now(timezone.utc) + SCHEDULER_LEASE)}, "$inc": {"sent_count": inserted}}
+        )
+        if result.matched_count != 1:
+            logger.warning(f"Lost lease on campaign {campaign['id']}, stopping after {queued} messages")
+            return
+
+    await db.campaigns.update_one(
+        {"id": campaign["id"], "lease_owner": INSTANCE_ID},
+        {"$set": {"status": "completed", "completed_at": iso(datetime.now(timezone.utc))}}
+    )
+    logger.info(f"Campaign {campaign['id']} queued {queued} messages")
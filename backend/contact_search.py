@@ -0,0 +1,78 @@
+import base64
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+PHONE_QUERY = re.compile(r"[\d\s+().\-]+")
+
+
+def normalize_name(name: Any) -> str:
+    """Name as stored in name_lower: whitespace collapsed, case folded"""
+    return " ".join(str(name or "").split()).casefold()
+
+
+def phone_digits(phone: Any) -> str:
+    """Phone number as stored in phone_digits: digits only, so "+1 (555) 010" and "1555010" match"""
+    return re.sub(r"\D", "", str(phone or ""))
+
+
+def search_fields(contact: Dict[str, Any]) -> Dict[str, str]:
+    """Derived fields the contact search indexes; set on every write of name or phone_number"""
+    return {"name_lower": normalize_name(contact.get("name")), "phone_digits": phone_digits(contact.get("phone_number"))}
+
+
+def encode_cursor(value: str, contact_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, contact_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    value, contact_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return value, contact_id
+
+
+def search_query(tenant_id: str, q: str, after: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
+    """Mongo filter and sort field for a contact search.
+
+    Queries made of phone characters match a prefix of phone_digits, anything else a
+    prefix of name_lower. Both are anchored, case-sensitive regexes on normalized
+    fields, which Mongo answers with a bounded scan of the (tenant_id, field, id)
+    index. Paging is keyset on (field, id) so deep pages cost the same as the first.
+    """
+    q = (q or "").strip()
+    if q and PHONE_QUERY.fullmatch(q) and phone_digits(q):
+        field, prefix = "phone_digits", phone_digits(q)
+    else:
+        field, prefix = "name_lower", normalize_name(q)
+
+    query = {"tenant_id": tenant_id}
+    condition = {"$regex": f"^{re.escape(prefix)}"} if prefix else {}
+    if after:
+        value, contact_id = decode_cursor(after)
+        query["$or"] = [
+            {field: {**condition, "$gt": value}},
+            {field: value, "id": {"$gt": contact_id}},
+        ]
+    elif condition:
+        query[field] = condition
+    return query, field
+
+
+async def backfill_search_fields(db, batch_size: int = 1000) -> int:
+    """Set name_lower / phone_digits on contacts stored before they existed.
+
+    The missing-field filter can't use an index, but it only runs until every contact has been backfilled.
+    """
+    from pymongo import UpdateOne
+
+    updated = 0
+    while True:
+        contacts = await db.contacts.find(
+            {"name_lower": {"$exists": False}}, {"_id": 1, "name": 1, "phone_number": 1}
+        ).to_list(batch_size)
+        if not contacts:
+            break
+        await db.contacts.bulk_write(
+            [UpdateOne({"_id": contact["_id"]}, {"$set": search_fields(contact)}) for contact in contacts], ordered=False
+        )
+        updated += len(contacts)
+    return updated
@@ -0,0 +1,77 @@
+from typing import Any, Dict
+
+PREVIEW_CHARS = 120
+
+
+def preview(content: str) -> str:
+    """One line of message text for the conversation list"""
+    text = " ".join((content or "").split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1] + "…"
+
+
+def last_message_fields(content: str, at: str, role: str) -> Dict[str, Any]:
+    return {"last_message_preview": preview(content), "last_message_at": at, "last_message_role": role}
+
+
+def advance_last_message(conversation_id: str, content: str, at: str, role: str):
+    """UpdateOne setting a conversation's last message, if it is newer than the one shown.
+
+    The filter on last_message_at keeps a delayed or retried webhook delivery from
+    moving the preview back to an older message.
+    """
+    from pymongo import UpdateOne
+
+    return UpdateOne(
+        {"id": conversation_id, "$or": [{"last_message_at": {"$lt": at}}, {"last_message_at": None}]},
+        {"$set": last_message_fields(content, at, role)}
+    )
+
+
+def read_update(user_id: str, inbound_count: int) -> Dict[str, Any]:
+    """Move a user's read position up to inbound_count ($max, so a stale read never moves it back)"""
+    return {"$max": {f"read_counts.{user_id}": inbound_count}}
+
+
+def with_unread_count(conversation: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Conversation as the API returns it to one user: their unread_count instead of everyone's read positions.
+
+    inbound_count counts the contact's messages and each user's read_counts entry is
+    how many of them they had seen, so unread counts are per agent without an update
+    per agent on every inbound message.
+    """
+    read_counts = conversation.pop("read_counts", None) or {}
+    conversation["unread_count"] = max(0, conversation.get("inbound_count", 0) - read_counts.get(user_id, 0))
+    return conversation
+
+
+async def backfill_last_messages(db, batch_size: int = 500) -> int:
+    """Set last_message_preview/last_message_at on conversations that predate them"""
+    from pymongo import UpdateOne
+
+    updated = 0
+    cursor = db.conversations.find({"last_message_at": {"$exists": False}}, {"_id": 0, "id": 1}).batch_size(batch_size)
+    batch = []
+
+    async def flush():
+        nonlocal updated
+        latest = await db.messages.aggregate([
+            {"$match": {"conversation_id": {"$in": batch}}},
+            {"$sort": {"conversation_id": 1, "timestamp": -1}},
+            {"$group": {"_id": "$conversation_id", "content": {"$first": "$content"}, "timestamp": {"$first": "$timestamp"}, "role": {"$first": "$role"}}},
+        ]).to_list(len(batch))
+        operations = [
+            UpdateOne({"id": message["_id"]}, {"$set": last_message_fields(message["content"], message["timestamp"], message["role"])})
+            for message in latest
+        ]
+        if operations:
+            result = await db.conversations.bulk_write(operations, ordered=False)
+            updated += result.modified_count
+        batch.clear()
+
+    async for conversation in cursor:
+        batch.append(conversation["id"])
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return updated
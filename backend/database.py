@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+from typing import Dict
+
+from lazy import LazyObject
+from metrics import create_command_listener
+
+logger = logging.getLogger(__name__)
+
+# Connection profiles: each workload gets a database handle with its own read
+# preference / write concern, all sharing one client and connection pool.
+#   default   - primary reads, acknowledged writes (the message write path)
+#   list      - tenant list screens, may lag the primary by a few seconds
+#   analytics - counts and reports, happy to read from a secondary
+#   telemetry - fire-and-forget inserts (raw webhook payloads), no journal wait
+PROFILE_ENV = {
+    "list": ("MONGO_LIST_READ_PREFERENCE", "secondaryPreferred"),
+    "analytics": ("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred"),
+}
+
+_databases: Dict[str, object] = {}
+_ready = False
+
+
+def mongo_url() -> str:
+    url = os.environ.get('MONGO_URL')
+    if not url:
+        logging.warning("MONGO_URL not set, falling back to localhost for development")
+        url = 'mongodb://localhost:27017'
+    return url
+
+
+def db_name() -> str:
+    return os.environ.get('DB_NAME', 'bantconfirm')
+
+
+def create_client():
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(
+        mongo_url(),
+        maxPoolSize=int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        minPoolSize=int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+        maxIdleTimeMS=int(os.environ.get("MONGO_MAX_IDLE_MS", "300000")),
+        event_listeners=[create_command_listener()]
+    )
+
+
+def get_database(profile: str = "default"):
+    """Database handle configured for a workload profile"""
+    database = _databases.get(profile)
+    if database is not None:
+        return database
+
+    options = {}
+    if profile in PROFILE_ENV:
+        from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+        env_name, default = PROFILE_ENV[profile]
+        mode = read_pref_mode_from_name(os.environ.get(env_name, default))
+        # maxStalenessSeconds must be -1 (unbounded) or at least 90; it is not allowed with primary
+        staleness = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "90")) if mode else -1
+        options["read_preference"] = make_read_preference(mode, None, staleness)
+    elif profile == "telemetry":
+        from pymongo import WriteConcern
+        options["write_concern"] = WriteConcern(w=int(os.environ.get("MONGO_TELEMETRY_W", "1")), j=False)
+    elif profile != "default":
+        raise ValueError(f"Unknown database profile: {profile}")
+
+    database = client.get_database(db_name(), **options)
+    _databases[profile] = database
+    return database
+
+
+# Constructed on first database access rather than at import
+client = LazyObject(create_client)
+db = LazyObject(lambda: get_database("default"))
+list_db = LazyObject(lambda: get_database("list"))
+analytics_db = LazyObject(lambda: get_database("analytics"))
+telemetry_db = LazyObject(lambda: get_database("telemetry"))
+
+
+async def warm_up():
+    """Open the pool's initial connections before traffic arrives instead of on the first requests"""
+    global _ready
+    connections = max(1, min(int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")), int(os.environ.get("MONGO_WARMUP_CONNECTIONS", "10"))))
+    try:
+        pings = asyncio.gather(*[client.admin.command("ping") for _ in range(connections)])
+        await asyncio.wait_for(pings, timeout=float(os.environ.get("MONGO_WARMUP_TIMEOUT", "10")))
+        _ready = True
+        logger.info(f"Database connection pool warmed up ({connections} connections)")
+    except Exception as e:
+        logger.error(f"Database warm-up failed: {str(e)}")
+
+
+async def check_ready() -> bool:
+    """True once the pool has been warmed up and the server still answers a ping"""
+    if not _ready:
+        await warm_up()
+        return _ready
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout=2.0)
+    except Exception:
+        return False
+    return True
+
+
+def close():
+    if client.is_loaded:
+        client.close()
@@ -0,0 +1,132 @@
+import asyncio
+import csv
+import io
+import os
+import re
+import tempfile
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from archive import archived_messages
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+CONTACT_COLUMNS = ["name", "phone_number", "email", "tags", "opted_in", "created_at"]
+TRANSCRIPT_COLUMNS = ["conversation_id", "contact_name", "contact_phone", "timestamp", "role", "content", "status"]
+
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+# ...but a signed number such as a phone number is only ever a number
+SIGNED_NUMBER = re.compile(r"[+-]?\d[\d ]*")
+
+
+def cell(value: Any) -> Any:
+    """A field as written to an export, with text that would run as a formula quoted"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        value = ";".join(str(v) for v in value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) and not SIGNED_NUMBER.fullmatch(value):
+        # Message content and contact names come from whoever messages the tenant
+        return "'" + value
+    return value
+
+
+async def batched(cursor, size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Documents from a cursor in lists of up to size, fetched a batch at a time"""
+    batch = []
+    async for doc in cursor.batch_size(size):
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def contact_rows(db, tenant_id: str) -> AsyncIterator[List[List[Any]]]:
+    projection = {"_id": 0, **{column: 1 for column in CONTACT_COLUMNS}}
+    cursor = db.contacts.find({"tenant_id": tenant_id}, projection).sort("phone_number", 1)
+    async for contacts in batched(cursor):
+        yield [[cell(contact.get(column)) for column in CONTACT_COLUMNS] for contact in contacts]
+
+
+async def transcript_rows(db, query: Dict[str, Any]) -> AsyncIterator[List[List[Any]]]:
+    """One row per message, conversation by conversation; per batch of conversations, archived messages come first"""
+    cursor = db.conversations.find(
+        query, {"_id": 0, "id": 1, "contact_name": 1, "contact_phone": 1, "archived_count": 1}
+    ).sort("updated_at", -1)
+
+    def row(conversation, message):
+        return [cell(v) for v in (
+            message["conversation_id"], conversation.get("contact_name"), conversation.get("contact_phone"),
+            message.get("timestamp"), message.get("role"), message.get("content"), message.get("status"),
+        )]
+
+    async for conversations in batched(cursor, 100):
+        by_id = {conversation["id"]: conversation for conversation in conversations}
+        archived = [conversation["id"] for conversation in conversations if conversation.get("archived_count")]
+        if archived:
+            yield [row(by_id[message["conversation_id"]], message) for message in await archived_messages(db, archived)]
+        messages = db.messages.find(
+            {"conversation_id": {"$in": list(by_id)}},
+            {"_id": 0, "conversation_id": 1, "timestamp": 1, "role": 1, "content": 1, "status": 1}
+        ).sort([("conversation_id", 1), ("timestamp", 1)])
+        async for batch in batched(messages):
+            yield [row(by_id[message["conversation_id"]], message) for message in batch]
+
+
+async def stream_csv(columns: List[str], rows: AsyncIterator[List[List[Any]]]) -> AsyncIterator[bytes]:
+    """CSV encoded one batch of rows at a time; a BOM up front so Excel reads it as UTF-8"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    async for batch in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def stream_xlsx(columns: List[str], rows: AsyncIterator[List[List[Any]]], title: str) -> AsyncIterator[bytes]:
+    """XLSX built with a write-only workbook, which spools rows to disk, then streamed from a temp file.
+
+    An xlsx is a zip whose directory comes last, so it can't go out before the last row is written.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(columns)
+    async for batch in rows:
+        await asyncio.to_thread(lambda b=batch: [sheet.append(row) for row in b])
+
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        await asyncio.to_thread(workbook.save, path)
+        with open(path, "rb") as f:
+            while True:
+                chunk = await asyncio.to_thread(f.read, EXPORT_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.unlink(path)
+
+
+def export_stream(format: str, columns: List[str], rows: AsyncIterator[List[List[Any]]], title: str) -> Tuple[AsyncIterator[bytes], str]:
+    """Body iterator and content type for an export in the given format"""
+    if format == "xlsx":
+        return stream_xlsx(columns, rows, title), CONTENT_TYPES["xlsx"]
+    return stream_csv(columns, rows), CONTENT_TYPES["csv"]
@@ -0,0 +1,95 @@
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+
+from lazy import lazy_import
+from metrics import track_outbound
+
+httpx = lazy_import("httpx")
+
+GRAPH_API_URL = os.environ.get("GRAPH_API_URL", "https://graph.facebook.com/v18.0")
+
+# Meta error codes that mean "slow down" rather than "this request is wrong"
+# https://developers.facebook.com/docs/whatsapp/cloud-api/support/error-codes
+RATE_LIMIT_CODES = {4, 80007, 130429, 131048, 131056}
+TRANSIENT_CODES = {1, 2, 131000, 131016}
+
+_client = None
+
+
+class GraphAPIError(Exception):
+    def __init__(self, status_code: int, message: str, code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.retry_after = retry_after
+
+    @property
+    def is_rate_limit(self) -> bool:
+        return self.status_code == 429 or self.code in RATE_LIMIT_CODES
+
+    @property
+    def is_retryable(self) -> bool:
+        return self.is_rate_limit or self.status_code >= 500 or self.code in TRANSIENT_CODES
+
+
+def get_client():
+    """Shared HTTP client so Graph API calls reuse pooled keep-alive connections"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(base_url=GRAPH_API_URL, timeout=30.0)
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request(method: str, path: str, access_token: str, **kwargs) -> Dict[str, Any]:
+    """Call the Graph API, raising GraphAPIError with Meta's error code on failure"""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    try:
+        with track_outbound("graph_api"):
+            response = await get_client().request(method, path, headers=headers, **kwargs)
+    except httpx.HTTPError as e:
+        # Network failures are worth retrying
+        raise GraphAPIError(503, f"Graph API unreachable: {str(e)}")
+
+    if response.status_code >= 400:
+        code = None
+        message = response.text[:500]
+        try:
+            error = response.json().get("error", {})
+            code = error.get("code")
+            message = error.get("message", message)
+        except ValueError:
+            pass
+        retry_after = response.headers.get("Retry-After")
+        raise GraphAPIError(response.status_code, message, code, float(retry_after) if retry_after and retry_after.isdigit() else None)
+    return response.json()
+
+
+async def send_message(config: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Send a WhatsApp message payload from the tenant's configured phone number"""
+    body = {"messaging_product": "whatsapp", **payload}
+    return await request("POST", f"/{config['phone_number_id']}/messages", config["access_token"], json=body)
+
+
+async def media_info(config: Dict[str, Any], media_id: str) -> Dict[str, Any]:
+    """Download URL, mime type and sha256 of an inbound media object"""
+    return await request("GET", f"/{media_id}", config["access_token"])
+
+
+async def iter_media(config: Dict[str, Any], url: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Stream media content from its (short-lived) download URL without buffering it"""
+    headers = {"Authorization": f"Bearer {config['access_token']}"}
+    try:
+        async with get_client().stream("GET", url, headers=headers) as response:
+            if response.status_code >= 400:
+                raise GraphAPIError(response.status_code, f"Media download failed with HTTP {response.status_code}")
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+    except httpx.HTTPError as e:
+        raise GraphAPIError(503, f"Graph API unreachable: {str(e)}")
@@ -0,0 +1,276 @@
+import logging
+import os
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Raw webhook payloads are deleted this long after receipt; 0 keeps them forever
+WEBHOOK_PAYLOAD_RETENTION_DAYS = int(os.environ.get("WEBHOOK_PAYLOAD_RETENTION_DAYS", "30"))
+
+# pymongo.ASCENDING / DESCENDING / TEXT, spelled out so importing this module doesn't pull in pymongo
+ASCENDING = 1
+DESCENDING = -1
+TEXT = "text"
+
+# Server error code when an index exists with the same keys but other options
+INDEX_OPTIONS_CONFLICT = 85
+
+
+def index(keys, **options):
+    """Index declaration; turned into a pymongo IndexModel by ensure_indexes"""
+    return (keys, options)
+
+
+# Every index the API relies on, by collection. Names are left to Mongo's defaults
+# (e.g. "tenant_id_1_status_1") so re-running create_indexes is a no-op.
+INDEXES = {
+    "users": [
+        index([("email", ASCENDING)], unique=True),
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING)]),
+    ],
+    "tenants": [
+        index([("id", ASCENDING)], unique=True),
+    ],
+    "whatsapp_accounts": [
+        index([("tenant_id", ASCENDING)]),
+    ],
+    "conversations": [
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING)]),
+        index([("tenant_id", ASCENDING), ("updated_at", DESCENDING)]),
+        index([("tenant_id", ASCENDING), ("assigned_agent_id", ASCENDING), ("updated_at", DESCENDING)]),
+        # at most one open conversation per contact, which inbound messages are appended to
+        index([("tenant_id", ASCENDING), ("contact_phone", ASCENDING)], unique=True, partialFilterExpression={"status": "open"}),
+        # message archival picks idle conversations that still have hot messages
+        index([("cold", ASCENDING), ("updated_at", ASCENDING)]),
+    ],
+    "message_archive": [
+        index([("id", ASCENDING)], unique=True),
+        index([("conversation_id", ASCENDING), ("first_timestamp", ASCENDING)]),
+    ],
+    "messages": [
+        index([("id", ASCENDING)], unique=True),
+        index([("conversation_id", ASCENDING)]),
+        index([("conversation_id", ASCENDING), ("timestamp", ASCENDING)]),
+        # message search: the tenant_id prefix keeps each $text query inside one tenant's postings
+        index([("tenant_id", ASCENDING), ("content", TEXT)]),
+        # delivery/read status webhooks identify messages by wamid, and inbound messages
+        # are appended by upserting on it; messages without one leave the field out
+        index([("wamid", ASCENDING)], unique=True, sparse=True),
+    ],
+    "chatbots": [
+        index([("tenant_id", ASCENDING), ("enabled", ASCENDING)]),
+    ],
+    "contacts": [
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING), ("phone_number", ASCENDING)]),
+        # multikey: one entry per tag, for campaign audiences
+        index([("tenant_id", ASCENDING), ("tags", ASCENDING)]),
+        # contact search: prefix regexes on normalized fields, keyset-paged on id
+        index([("tenant_id", ASCENDING), ("name_lower", ASCENDING), ("id", ASCENDING)]),
+        index([("tenant_id", ASCENDING), ("phone_digits", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "templates": [
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING), ("status", ASCENDING)]),
+        # template status webhooks identify templates by Meta's id
+        index([("meta_template_id", ASCENDING)], sparse=True),
+    ],
+    "campaigns": [
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING)]),
+        index([("status", ASCENDING), ("scheduled_at", ASCENDING)]),
+        index([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+    ],
+    "meta_configs": [
+        index([("tenant_id", ASCENDING)], unique=True),
+        index([("phone_number_id", ASCENDING)]),
+        index([("webhook_verify_token", ASCENDING)]),
+    ],
+    "user_permissions": [
+        index([("user_id", ASCENDING), ("tenant_id", ASCENDING)]),
+    ],
+    "webhook_messages": [
+        # payloads stored before wamid was recorded have no wamid and stay out of the index
+        index([("wamid", ASCENDING)], unique=True, partialFilterExpression={"wamid": {"$type": "string"}}),
+    ] + ([
+        index([("received_at", ASCENDING)], expireAfterSeconds=WEBHOOK_PAYLOAD_RETENTION_DAYS * 86400),
+    ] if WEBHOOK_PAYLOAD_RETENTION_DAYS > 0 else []),
+    # GridFS bucket of BlobStore; the filename is the content's sha256
+    "blobs.files": [
+        index([("filename", ASCENDING)], unique=True),
+    ],
+    "outbox": [
+        index([("id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING), ("idempotency_key", ASCENDING)], unique=True),
+        index([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        index([("wamid", ASCENDING)]),
+    ],
+    "outbox_pauses": [
+        index([("tenant_id", ASCENDING)], unique=True),
+        # a pause is deleted once it is over
+        index([("paused_until", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "job_leases": [
+        index([("id", ASCENDING)], unique=True),
+    ],
+    "usage_ledger": [
+        # the cross-tenant report pages through one period by tenant_id
+        index([("period", ASCENDING), ("tenant_id", ASCENDING)], unique=True),
+        index([("tenant_id", ASCENDING), ("period", ASCENDING)]),
+    ],
+}
+
+# Indexes no longer wanted, dropped where an earlier deploy created them. With
+# retention off the TTL index has to go, or it keeps deleting payloads.
+RETIRED_INDEXES = {
+    "webhook_messages": [[("received_at", ASCENDING)]] if WEBHOOK_PAYLOAD_RETENTION_DAYS <= 0 else [],
+}
+
+# Representative filter/sort for each query the API issues, used to verify the
+# registry above with explain(). Values only need the right type.
+QUERY_SHAPES = [
+    ("users", {"email": "a@example.com"}, None),
+    ("users", {"id": {"$in": ["u1", "u2"]}}, None),
+    ("users", {"tenant_id": "t1"}, None),
+    ("users", {"id": "u1", "tenant_id": "t1"}, None),
+    ("tenants", {"id": "t1"}, None),
+    ("whatsapp_accounts", {"tenant_id": "t1"}, None),
+    ("conversations", {"id": {"$in": ["c1", "c2"]}}, None),
+    ("conversations", {"tenant_id": "t1"}, [("updated_at", DESCENDING)]),
+    ("conversations", {"tenant_id": "t1", "assigned_agent_id": "u1"}, [("updated_at", DESCENDING)]),
+    ("conversations", {"tenant_id": "t1", "contact_phone": {"$in": ["+15550000000", "+15550000001"]}, "status": "open"}, None),
+    ("conversations", {"cold": {"$in": [None, False]}, "updated_at": {"$lt": "2026-01-01T00:00:00+00:00"}}, None),
+    ("message_archive", {"conversation_id": {"$in": ["c1", "c2"]}}, [("conversation_id", ASCENDING), ("first_timestamp", ASCENDING)]),
+    ("message_archive", {"conversation_id": "c1"}, [("first_timestamp", ASCENDING)]),
+    ("message_archive", {"id": {"$in": ["c1:m1", "c1:m2"]}}, None),
+    ("message_archive", {"conversation_id": "c1", "last_timestamp": {"$gte": "2026-01-01T00:00:00+00:00"}}, None),
+    ("messages", {"id": "m1"}, None),
+    ("messages", {"conversation_id": "c1"}, [("timestamp", ASCENDING)]),
+    ("messages", {"conversation_id": {"$in": ["c1", "c2"]}}, [("conversation_id", ASCENDING), ("timestamp", ASCENDING)]),
+    ("messages", {"tenant_id": "t1", "$text": {"$search": "refund order"}}, None),
+    ("messages", {"conversation_id": {"$in": ["c1", "c2"]}, "tenant_id": {"$exists": False}}, None),
+    ("chatbots", {"tenant_id": "t1"}, None),
+    ("chatbots", {"tenant_id": "t1", "enabled": True}, None),
+    ("contacts", {"tenant_id": "t1"}, None),
+    ("contacts", {"tenant_id": "t1"}, [("phone_number", ASCENDING)]),
+    ("contacts", {"tenant_id": "t1", "phone_number": "+15550000000"}, None),
+    ("contacts", {"tenant_id": "t1", "id": {"$in": ["ct1", "ct2"]}, "opted_in": {"$ne": False}}, None),
+    ("contacts", {"tenant_id": "t1", "tags": {"$in": ["vip", "newsletter"]}, "opted_in": True}, None),
+    ("contacts", {"tenant_id": "t1", "tags": {"$all": ["vip", "newsletter"]}, "opted_in": True}, None),
+    ("contacts", {"tenant_id": "t1", "name_lower": {"$regex": "^ann"}}, [("name_lower", ASCENDING), ("id", ASCENDING)]),
+    ("contacts", {"tenant_id": "t1", "phone_digits": {"$regex": "^1555"}}, [("phone_digits", ASCENDING), ("id", ASCENDING)]),
+    ("contacts", {"tenant_id": "t1", "$or": [
+        {"name_lower": {"$regex": "^ann", "$gt": "anna"}}, {"name_lower": "anna", "id": {"$gt": "ct1"}}
+    ]}, [("name_lower", ASCENDING), ("id", ASCENDING)]),
+    ("templates", {"tenant_id": "t1"}, None),
+    ("templates", {"tenant_id": "t1", "status": "APPROVED"}, None),
+    ("templates", {"id": "tp1", "tenant_id": "t1"}, None),
+    ("templates", {"meta_template_id": "1234567890"}, None),
+    ("campaigns", {"tenant_id": "t1"}, None),
+    ("campaigns", {"status": "scheduled", "scheduled_at": {"$lte": "2026-01-01T00:00:00.000000+00:00"}}, [("scheduled_at", ASCENDING)]),
+    ("campaigns", {"status": "running", "lease_expires_at": {"$lt": "2026-01-01T00:00:00.000000+00:00"}}, None),
+    ("campaigns", {"id": "c1", "tenant_id": "t1", "status": {"$in": ["draft", "scheduled"]}}, None),
+    ("meta_configs", {"tenant_id": {"$in": ["t1", "t2"]}}, None),
+    ("meta_configs", {"webhook_verify_token": "token"}, None),
+    ("meta_configs", {"phone_number_id": {"$in": ["pn1", "pn2"]}}, None),
+    ("user_permissions", {"user_id": "u1"}, None),
+    ("user_permissions", {"user_id": "u1", "tenant_id": "t1"}, None),
+    ("blobs.files", {"filename": "0" * 64}, None),
+    ("outbox", {"id": "o1", "tenant_id": "t1"}, None),
+    ("outbox", {"tenant_id": "t1", "idempotency_key": "k1"}, None),
+    ("outbox", {"status": {"$in": ["queued", "sending"]}, "next_attempt_at": {"$lte": datetime(2026, 1, 1, tzinfo=timezone.utc)}}, [("next_attempt_at", ASCENDING)]),
+    ("outbox", {"wamid": {"$in": ["w1", "w2"]}}, None),
+    ("outbox_pauses", {"paused_until": {"$gt": datetime(2026, 1, 1, tzinfo=timezone.utc)}}, None),
+    ("outbox", {"wamid": {"$in": ["w1", "w2"]}, "status_flush_id": "f1"}, None),
+    ("job_leases", {"id": "template_sync", "expires_at": {"$lte": "2026-01-01T00:00:00.000000+00:00"}}, None),
+    ("usage_ledger", {"period": "2026-10", "tenant_id": {"$gt": "t1"}}, [("tenant_id", ASCENDING)]),
+    ("usage_ledger", {"tenant_id": "t1", "period": {"$regex": "^\\d{4}-\\d{2}$", "$gte": "2026-01"}}, [("period", ASCENDING)]),
+]
+
+
+async def update_ttl(db, collection: str, keys, expire_after_seconds: int):
+    """Change the expiry of an existing TTL index, e.g. after a retention setting changed"""
+    from pymongo.errors import OperationFailure
+
+    try:
+        await db.command("collMod", collection, index={"keyPattern": dict(keys), "expireAfterSeconds": expire_after_seconds})
+        logger.info(f"Updated TTL of {keys} on {collection} to {expire_after_seconds}s")
+    except OperationFailure as e:
+        logger.error(f"Failed to update TTL of {keys} on {collection}: {str(e)}")
+
+
+async def replace_index(db, collection: str, keys, options):
+    """Drop an index declared with other options (e.g. made unique) and create it as declared now"""
+    from pymongo import IndexModel
+    from pymongo.errors import OperationFailure
+
+    model = IndexModel(keys, **options)
+    name = model.document["name"]
+    previous = (await db[collection].index_information()).get(name)
+    try:
+        await db[collection].drop_index(name)
+        await db[collection].create_indexes([model])
+        logger.info(f"Replaced index {keys} on {collection}")
+    except OperationFailure as e:
+        logger.error(f"Failed to replace index {keys} on {collection}: {str(e)}")
+        if previous:
+            # Put the old definition back rather than leave the keys unindexed
+            options = {k: v for k, v in previous.items() if k not in ("key", "v", "ns")}
+            await db[collection].create_indexes([IndexModel(list(previous["key"]), **options)])
+
+
+async def drop_retired_indexes(db):
+    from pymongo import IndexModel
+    from pymongo.errors import OperationFailure
+
+    for collection, retired in RETIRED_INDEXES.items():
+        if not retired:
+            continue
+        existing = await db[collection].index_information()
+        for keys in retired:
+            name = IndexModel(keys).document["name"]
+            if name not in existing:
+                continue
+            try:
+                await db[collection].drop_index(name)
+                logger.info(f"Dropped retired index {keys} on {collection}")
+            except OperationFailure as e:
+                logger.error(f"Failed to drop index {keys} on {collection}: {str(e)}")
+
+
+async def ensure_indexes(db):
+    """Create every registered index and drop retired ones; existing identical indexes are left untouched"""
+    from pymongo import IndexModel
+    from pymongo.errors import OperationFailure
+
+    await drop_retired_indexes(db)
+
+    for collection, specs in INDEXES.items():
+        try:
+            await db[collection].create_indexes([IndexModel(keys, **options) for keys, options in specs])
+        except OperationFailure:
+            # One bad index (e.g. a unique one over existing duplicates) fails the whole
+            # command, so retry one at a time to create the rest and report the culprit
+            for keys, options in specs:
+                try:
+                    await db[collection].create_indexes([IndexModel(keys, **options)])
+                except OperationFailure as e:
+                    if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in options:
+                        await update_ttl(db, collection, keys, options["expireAfterSeconds"])
+                    elif e.code == INDEX_OPTIONS_CONFLICT:
+                        await replace_index(db, collection, keys, options)
+                    else:
+                        logger.error(f"Failed to create index {keys} on {collection}: {str(e)}")
+
+
+def find_collscan(plan) -> bool:
+    """Return True if a query plan (or any of its input stages) scans the whole collection"""
+    if isinstance(plan, dict):
+        if plan.get("stage") == "COLLSCAN":
+            return True
+        return any(find_collscan(value) for value in plan.values())
+    if isinstance(plan, list):
+        return any(find_collscan(item) for item in plan)
+    return False
@@ -0,0 +1,44 @@
+import importlib
+import threading
+from typing import Any, Callable
+
+
+class LazyObject:
+    """Proxy that builds its target on first attribute or item access.
+
+    Used to keep heavy imports and client construction out of module import, which
+    every serverless cold start pays for.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self):
+        target = object.__getattribute__(self, "_target")
+        if target is None:
+            with object.__getattribute__(self, "_lock"):
+                target = object.__getattribute__(self, "_target")
+                if target is None:
+                    target = object.__getattribute__(self, "_factory")()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    @property
+    def is_loaded(self) -> bool:
+        return object.__getattribute__(self, "_target") is not None
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._resolve(), name, value)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+
+def lazy_import(module_name: str) -> LazyObject:
+    """Module proxy that imports on first use, e.g. ``pd = lazy_import("pandas")``"""
+    return LazyObject(lambda: importlib.import_module(module_name))
@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+from typing import Any, Dict, Optional, Set
+
+# Per-request cache of in-flight/completed lookups, installed by LoaderScopeMiddleware
+_request_cache: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar("loader_request_cache", default=None)
+
+
+class BatchLoader:
+    """Coalesce by-key point reads on one collection into a single $in query per event loop tick.
+
+    Lookups issued concurrently (by any request) before the loop gets back to the
+    scheduled dispatch share one query. Within a request, repeated lookups of the
+    same key are served from the request cache without touching Mongo again.
+    """
+
+    def __init__(self, db, collection: str, key: str = "id", projection: Optional[Dict] = None, max_batch_size: int = 500):
+        # db is resolved lazily so loaders can be declared before the client exists
+        self.db = db
+        self.collection = collection
+        self.key = key
+        self.projection = projection or {"_id": 0}
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[Any, asyncio.Future] = {}
+        self._scheduled = False
+        # The loop only keeps weak references to tasks, so in-flight fetches are held here
+        self._fetches: Set[asyncio.Task] = set()
+
+    async def load(self, key: Any) -> Optional[Dict]:
+        cache = _request_cache.get()
+        cache_key = (id(self), key)
+        future = cache.get(cache_key) if cache is not None else None
+        if future is None:
+            future = self._enqueue(key)
+            if cache is not None:
+                cache[cache_key] = future
+        # shield so a cancelled caller doesn't cancel the lookup for everyone sharing it
+        doc = await asyncio.shield(future)
+        return dict(doc) if doc is not None else None
+
+    def clear(self, key: Any):
+        """Drop a key from the current request's cache after writing to it"""
+        cache = _request_cache.get()
+        if cache is not None:
+            cache.pop((id(self), key), None)
+
+    def _enqueue(self, key: Any) -> asyncio.Future:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if not self._scheduled:
+                self._scheduled = True
+                loop.call_soon(self._dispatch)
+        return future
+
+    def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        self._scheduled = False
+        task = asyncio.ensure_future(self._fetch(batch))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+
+    async def _fetch(self, batch: Dict[Any, asyncio.Future]):
+        keys = list(batch)
+        try:
+            for i in range(0, len(keys), self.max_batch_size):
+                chunk = keys[i:i + self.max_batch_size]
+                found = {}
+                async for doc in self.db[self.collection].find({self.key: {"$in": chunk}}, self.projection):
+                    found[doc.get(self.key)] = doc
+                for key in chunk:
+                    if not batch[key].done():
+                        batch[key].set_result(found.get(key))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+
+class LoaderScopeMiddleware:
+    """ASGI middleware giving each HTTP request its own loader cache"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
@@ -0,0 +1,76 @@
+import asyncio
+import base64
+import io
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+from blobstore import BlobStore
+
+logger = logging.getLogger(__name__)
+
+LOGO_SIZES = (64, 128, 256)
+MAX_LOGO_BYTES = int(os.environ.get("MAX_LOGO_BYTES", str(2 * 1024 * 1024)))
+
+
+def logo_url(sha256: str) -> str:
+    return f"/api/logos/{sha256}"
+
+
+def decode_base64_logo(value: str) -> bytes:
+    """Bytes of a base64 logo, with or without a data: URL prefix"""
+    if value.startswith("data:"):
+        value = value.split(",", 1)[-1]
+    return base64.b64decode(value, validate=False)
+
+
+def render_logo(data: bytes) -> Tuple[str, List[Tuple[int, bytes]]]:
+    """Content type of the original and PNG thumbnails at each LOGO_SIZES bound (CPU-bound; run in a thread)"""
+    from PIL import Image
+
+    if len(data) > MAX_LOGO_BYTES:
+        raise ValueError(f"Logo must be at most {MAX_LOGO_BYTES // 1024} KB")
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception:
+        raise ValueError("Logo must be a PNG, JPEG, GIF or WebP image")
+    content_type = Image.MIME.get(image.format, "application/octet-stream")
+    image = image.convert("RGBA")
+
+    thumbnails = []
+    for size in LOGO_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format="PNG", optimize=True)
+        thumbnails.append((size, buffer.getvalue()))
+    return content_type, thumbnails
+
+
+async def store_logo(blobs: BlobStore, data: bytes) -> Dict[str, Any]:
+    """Store a logo and its thumbnails; returns the tenant fields pointing at them"""
+    content_type, thumbnails = await asyncio.to_thread(render_logo, data)
+    original = await blobs.put_bytes(data, content_type, "logo")
+    urls = {"original": logo_url(original["sha256"])}
+    for size, thumbnail in thumbnails:
+        stored = await blobs.put_bytes(thumbnail, "image/png", "logo")
+        urls[str(size)] = logo_url(stored["sha256"])
+    return {"logo_url": urls["original"], "logo_urls": urls}
+
+
+async def migrate_logo_base64(db, blobs: BlobStore) -> int:
+    """Move logo_base64 fields off tenant documents into the blob store"""
+    migrated = 0
+    cursor = db.tenants.find({"logo_base64": {"$exists": True}}, {"_id": 0, "id": 1, "logo_base64": 1})
+    async for tenant in cursor:
+        update: Dict[str, Any] = {"$unset": {"logo_base64": ""}}
+        try:
+            if tenant.get("logo_base64"):
+                update["$set"] = await store_logo(blobs, decode_base64_logo(tenant["logo_base64"]))
+        except ValueError as e:
+            # Not a usable image; it was never displayed anyway
+            logger.warning(f"Dropping invalid logo of tenant {tenant['id']}: {str(e)}")
+        await db.tenants.update_one({"id": tenant["id"]}, update)
+        migrated += 1
+    return migrated
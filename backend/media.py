@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import graph_api
+from blobstore import BlobStore
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"image", "audio", "video", "document", "sticker"}
+MEDIA_CONCURRENCY = int(os.environ.get("MEDIA_CONCURRENCY", "4"))
+
+
+def media_ref(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """The media object of an inbound webhook message (id, mime_type, sha256, caption...), if it has one"""
+    if message.get("type") in MEDIA_TYPES:
+        return message.get(message["type"])
+    return None
+
+
+class MediaFetcher:
+    """Copies inbound media from the Graph API into the blob store.
+
+    Media URLs expire, so each message's media is fetched soon after the webhook
+    arrives, in the background with bounded concurrency; get() fetches on demand if
+    that didn't happen. Meta sends the content's sha256 with the message, so media
+    already in the store is never downloaded again.
+    """
+
+    def __init__(self, db, blobs: BlobStore, get_config: Callable[[str], Awaitable[Optional[Dict]]]):
+        self.db = db
+        self.blobs = blobs
+        self.get_config = get_config
+        self._semaphore = asyncio.Semaphore(MEDIA_CONCURRENCY)
+        self._tasks = set()
+
+    def prefetch(self, message: Dict[str, Any]):
+        task = asyncio.create_task(self._prefetch(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _prefetch(self, message: Dict[str, Any]):
+        try:
+            async with self._semaphore:
+                await self.get(message)
+        except Exception as e:
+            logger.error(f"Media fetch failed for message {message['id']}: {str(e)}")
+
+    async def get(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Stored media of a message, downloading it first if needed; returns sha256, size and content_type"""
+        media = message["media"]
+        if media.get("stored"):
+            return media
+
+        stored = None
+        if media.get("sha256") and await self.blobs.find(media["sha256"]):
+            stored = {"sha256": media["sha256"], "content_type": media.get("mime_type")}
+        else:
+            config = await self.get_config(message["tenant_id"])
+            if not config:
+                raise graph_api.GraphAPIError(400, "WhatsApp API not configured")
+            info = await graph_api.media_info(config, media["id"])
+            content_type = info.get("mime_type") or media.get("mime_type") or "application/octet-stream"
+            stored = await self.blobs.put_stream(graph_api.iter_media(config, info["url"]), content_type, "media")
+
+        update = {"media.sha256": stored["sha256"], "media.content_type": stored["content_type"], "media.stored": True}
+        if "size" in stored:
+            update["media.size"] = stored["size"]
+        await self.db.messages.update_one({"id": message["id"]}, {"$set": update})
+        return {**media, **{key.split(".", 1)[1]: value for key, value in update.items()}}
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,98 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+SNIPPET_CHARS = 160
+# Ranking only looks at the best matches; enough to fill many pages of conversations
+SEARCH_MAX_MATCHES = int(os.environ.get("MESSAGE_SEARCH_MAX_MATCHES", "1000"))
+
+TERM = re.compile(r'"([^"]+)"|(-?\S+)')
+
+
+def query_terms(q: str) -> List[str]:
+    """Words and quoted phrases of a $text search string, without negated terms"""
+    terms = []
+    for phrase, word in TERM.findall(q):
+        if phrase:
+            terms.append(phrase)
+        elif not word.startswith("-"):
+            terms.append(word.strip(".,!?;:"))
+    return [term for term in terms if term]
+
+
+def highlight(content: str, q: str, width: int = SNIPPET_CHARS) -> Tuple[str, List[List[int]]]:
+    """Snippet of content around the first match and the [start, end) offsets of matches within it.
+
+    $text matches on stems, so each term is matched as a word prefix; offsets rather
+    than markup leave escaping to the client.
+    """
+    terms = query_terms(q)
+    if not terms:
+        return content[:width], []
+    pattern = re.compile(r"\b(?:" + "|".join(re.escape(term) for term in terms) + r")\w*", re.IGNORECASE)
+    first = pattern.search(content)
+    start = 0
+    if first and len(content) > width:
+        start = max(0, min(first.start() - width // 4, len(content) - width))
+    snippet = content[start:start + width]
+    highlights = [[m.start(), m.end()] for m in pattern.finditer(snippet)]
+    if start > 0:
+        snippet = "…" + snippet
+        highlights = [[s + 1, e + 1] for s, e in highlights]
+    if start + width < len(content):
+        snippet += "…"
+    return snippet, highlights
+
+
+def search_pipeline(tenant_id: str, q: str, skip: int, limit: int, conversation_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Aggregation ranking a tenant's conversations by their best-matching message.
+
+    The $text match runs on the (tenant_id, content text) index, so it only ever
+    touches this tenant's postings. Each conversation is scored by its best message
+    and returned with that message.
+    """
+    match = {"tenant_id": tenant_id, "$text": {"$search": q}}
+    if conversation_ids is not None:
+        match["conversation_id"] = {"$in": conversation_ids}
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "id": 1, "conversation_id": 1, "role": 1, "content": 1, "timestamp": 1, "score": {"$meta": "textScore"}}},
+        {"$sort": {"score": -1, "timestamp": -1}},
+        {"$limit": SEARCH_MAX_MATCHES},
+        {"$group": {
+            "_id": "$conversation_id",
+            "score": {"$max": "$score"},
+            "matches": {"$sum": 1},
+            "message": {"$first": {"id": "$id", "role": "$role", "content": "$content", "timestamp": "$timestamp"}},
+        }},
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit + 1},
+    ]
+
+
+async def backfill_message_tenants(db, batch_size: int = 500) -> int:
+    """Copy tenant_id from conversations onto their older messages, which predate the field"""
+    updated = 0
+    cursor = db.conversations.find({}, {"_id": 0, "id": 1, "tenant_id": 1}).batch_size(batch_size)
+    batch = []
+
+    async def flush():
+        nonlocal updated
+        by_tenant: Dict[str, List[str]] = {}
+        for conversation in batch:
+            by_tenant.setdefault(conversation.get("tenant_id"), []).append(conversation["id"])
+        for tenant_id, ids in by_tenant.items():
+            result = await db.messages.update_many(
+                {"conversation_id": {"$in": ids}, "tenant_id": {"$exists": False}}, {"$set": {"tenant_id": tenant_id}}
+            )
+            updated += result.modified_count
+        batch.clear()
+
+    async for conversation in cursor:
+        batch.append(conversation)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    return updated
@@ -0,0 +1,207 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+class RequestStats:
+    """Per-request accumulator; the route is read from the ASGI scope once FastAPI has matched it"""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_ops = 0
+        self.db_seconds = 0.0
+        self.http_seconds = 0.0
+        self.llm_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def current_route() -> str:
+    stats = _request_stats.get()
+    return stats.route if stats else "background"
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {series[-1]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Total request latency", ("route", "method", "status"))
+DB_COMMAND_DURATION = Histogram("mongo_command_duration_seconds", "MongoDB command latency", ("route", "command", "collection"))
+DB_COMMAND_FAILURES = Counter("mongo_command_failures_total", "MongoDB commands that failed", ("route", "command", "collection"))
+DB_DOCS_RETURNED = Counter("mongo_documents_returned_total", "Documents returned by MongoDB cursors", ("route", "collection"))
+DB_OPS_PER_REQUEST = Histogram("mongo_commands_per_request", "MongoDB commands issued per request", ("route",), buckets=COUNT_BUCKETS)
+OUTBOUND_DURATION = Histogram("outbound_duration_seconds", "Time spent waiting on external services", ("route", "target"))
+REQUEST_TIME_BREAKDOWN = Counter("request_time_seconds_total", "Request time by where it was spent (db, http, llm)", ("route", "component"))
+
+REGISTRY = [REQUEST_DURATION, DB_COMMAND_DURATION, DB_COMMAND_FAILURES, DB_DOCS_RETURNED, DB_OPS_PER_REQUEST, OUTBOUND_DURATION, REQUEST_TIME_BREAKDOWN]
+
+
+def render_metrics() -> str:
+    """Render every registered metric in Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def create_command_listener():
+    """Build the PyMongo command listener feeding the DB metrics, tagged with the active route.
+
+    Motor runs PyMongo on an executor with a copy of the caller's context, so the
+    request's RequestStats are visible here. pymongo is imported here rather than at
+    module level so importing metrics stays cheap.
+    """
+    from pymongo import monitoring
+
+    class CommandMetricsListener(monitoring.CommandListener):
+        def __init__(self):
+            self._collections: Dict[Tuple, str] = {}
+
+        def started(self, event):
+            collection = event.command.get(event.command_name)
+            self._collections[(event.request_id, event.connection_id)] = collection if isinstance(collection, str) else ""
+
+        def succeeded(self, event):
+            collection = self._collections.pop((event.request_id, event.connection_id), "")
+            seconds = event.duration_micros / 1_000_000
+            stats = _request_stats.get()
+            route = stats.route if stats else "background"
+            DB_COMMAND_DURATION.observe(seconds, route, event.command_name, collection)
+            if stats:
+                stats.db_ops += 1
+                stats.db_seconds += seconds
+            cursor = event.reply.get("cursor") if isinstance(event.reply, dict) else None
+            if cursor:
+                batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+                DB_DOCS_RETURNED.inc(route, collection, amount=len(batch))
+
+        def failed(self, event):
+            collection = self._collections.pop((event.request_id, event.connection_id), "")
+            stats = _request_stats.get()
+            route = stats.route if stats else "background"
+            DB_COMMAND_DURATION.observe(event.duration_micros / 1_000_000, route, event.command_name, collection)
+            DB_COMMAND_FAILURES.inc(route, event.command_name, collection)
+
+    return CommandMetricsListener()
+
+
+@contextmanager
+def track_outbound(target: str):
+    """Time a call to an external service ("graph_api", "llm", ...) and attribute it to the request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stats = _request_stats.get()
+        OUTBOUND_DURATION.observe(seconds, stats.route if stats else "background", target)
+        if stats:
+            if target == "llm":
+                stats.llm_seconds += seconds
+            else:
+                stats.http_seconds += seconds
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency and the DB/HTTP/LLM share of it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            route = stats.route
+            REQUEST_DURATION.observe(time.perf_counter() - start, route, scope.get("method", ""), str(status_code))
+            DB_OPS_PER_REQUEST.observe(stats.db_ops, route)
+            REQUEST_TIME_BREAKDOWN.inc(route, "db", amount=stats.db_seconds)
+            REQUEST_TIME_BREAKDOWN.inc(route, "http", amount=stats.http_seconds)
+            REQUEST_TIME_BREAKDOWN.inc(route, "llm", amount=stats.llm_seconds)
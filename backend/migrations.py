@@ -0,0 +1,26 @@
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+
+async def run_once(db, name: str, job: Callable[[], Awaitable[int]]):
+    """Run a data migration unless the migrations collection records it as done.
+
+    Jobs must be safe to re-run: a replica that dies part-way (or two replicas
+    starting together) just runs it again over whatever is left.
+    """
+    if await db.migrations.find_one({"id": name}, {"_id": 1}):
+        return
+    try:
+        count = await job()
+    except Exception as e:
+        logger.error(f"Migration {name} failed: {str(e)}")
+        return
+    await db.migrations.update_one(
+        {"id": name},
+        {"$set": {"completed_at": datetime.now(timezone.utc).isoformat(), "documents": count}},
+        upsert=True
+    )
+    logger.info(f"Migration {name} completed ({count} documents)")
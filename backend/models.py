@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, Field
+from typing import List, Literal, Optional, Dict, Any
 from datetime import datetime
 import uuid
 
@@ -44,4 +44,31 @@ class InviteUser(BaseModel):
     email: str
     name: str
     role: str  # tenant_admin, manager, agent, viewer
-    permissions: List[Permission] = []
\ No newline at end of file
+    permissions: List[Permission] = []
+
+class AudienceSegment(BaseModel):
+    tags: List[str] = []  # empty means every contact
+    match: Literal["any", "all"] = "any"
+    opted_in_only: bool = True
+
+class ContactBatchItem(BaseModel):
+    id: Optional[str] = None  # update this contact; without an id, the contact with this phone_number is updated or created
+    phone_number: Optional[str] = None
+    name: Optional[str] = None
+    email: Optional[EmailStr] = None
+    tags: Optional[List[str]] = None
+    opted_in: Optional[bool] = None
+
+class ContactBatch(BaseModel):
+    contacts: List[ContactBatchItem]
+
+class SendBatch(BaseModel):
+    to: List[str]
+    message: str
+
+class PermissionUpdate(BaseModel):
+    user_id: str
+    permissions: List[Permission]
+
+class PermissionBatch(BaseModel):
+    updates: List[PermissionUpdate]
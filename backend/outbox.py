@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import graph_api
+from graph_api import GraphAPIError
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BASE_DELAY = float(os.environ.get("OUTBOX_BASE_DELAY_SECONDS", "2"))
+OUTBOX_MAX_DELAY = float(os.environ.get("OUTBOX_MAX_DELAY_SECONDS", "900"))
+OUTBOX_RATE_LIMIT_DELAY = float(os.environ.get("OUTBOX_RATE_LIMIT_DELAY_SECONDS", "60"))
+OUTBOX_LEASE_SECONDS = 120
+OUTBOX_IDLE_POLL_SECONDS = 5.0
+# How long the set of paused tenants is reused before outbox_pauses is read again
+OUTBOX_PAUSE_REFRESH_SECONDS = 1.0
+
+# queued -> sending -> sent | failed; a failed attempt goes back to queued with a later next_attempt_at.
+# After sending, status webhooks move it on to delivered -> read (or failed), see statuses.py
+PENDING_STATUSES = ["queued", "sending"]
+
+
+def backoff_delay(attempts: int, error: GraphAPIError) -> float:
+    """Exponential backoff with full jitter; rate limits wait at least Retry-After or the rate-limit floor"""
+    delay = random.uniform(0, min(OUTBOX_MAX_DELAY, OUTBOX_BASE_DELAY * (2 ** (attempts - 1))))
+    if error.is_rate_limit:
+        delay = max(delay, error.retry_after or OUTBOX_RATE_LIMIT_DELAY)
+    return delay
+
+
+def as_utc(value: datetime) -> datetime:
+    # Mongo hands datetimes back naive (in UTC) unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def public_view(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Outbox record as returned by the API"""
+    fields = ["id", "status", "to", "attempts", "wamid", "last_error", "idempotency_key", "created_at", "sent_at", "delivered_at", "read_at", "next_attempt_at"]
+    result = {}
+    for field in fields:
+        value = doc.get(field)
+        result[field] = value.isoformat() if isinstance(value, datetime) else value
+    return result
+
+
+class Outbox:
+    """Durable queue of outbound WhatsApp messages drained by a pool of asyncio workers.
+
+    Each message is stored before anything is sent, keyed by (tenant_id, idempotency_key),
+    so a client retry returns the original record instead of sending twice. Workers claim
+    due messages with a lease, so a crashed worker's message is picked up again once the
+    lease expires. ``on_sent`` is called with each message Meta accepted.
+
+    When Meta rate-limits a tenant, the tenant is paused in outbox_pauses until the
+    backoff is over and no worker (on any replica) claims its messages meanwhile,
+    rather than only the one message that hit the limit waiting.
+    """
+
+    def __init__(
+        self,
+        db,
+        get_config: Callable[[str], Awaitable[Optional[Dict]]],
+        workers: int = OUTBOX_WORKERS,
+        on_sent: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.db = db
+        self.get_config = get_config
+        self.workers = workers
+        self.on_sent = on_sent
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._paused: Dict[str, datetime] = {}
+        self._paused_read_at = 0.0
+
+    @staticmethod
+    def build(tenant_id: str, to: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None, **metadata) -> Dict[str, Any]:
+        now = datetime.now(timezone.utc)
+        return {
+            "id": str(uuid.uuid4()),
+            "tenant_id": tenant_id,
+            "idempotency_key": idempotency_key or str(uuid.uuid4()),
+            "to": to,
+            "payload": payload,
+            "status": "queued",
+            "attempts": 0,
+            # also serves as the lease expiry while a worker holds the message
+            "next_attempt_at": now,
+            "last_error": None,
+            "wamid": None,
+            "created_at": now,
+            "sent_at": None,
+            **metadata,
+        }
+
+    async def enqueue(self, tenant_id: str, to: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None, **metadata) -> Dict[str, Any]:
+        """Store a message for delivery; returns the existing record if the idempotency key was already used"""
+        from pymongo.errors import DuplicateKeyError
+
+        doc = self.build(tenant_id, to, payload, idempotency_key, **metadata)
+        try:
+            await self.db.outbox.insert_one(doc)
+        except DuplicateKeyError:
+            return await self.db.outbox.find_one({"tenant_id": tenant_id, "idempotency_key": doc["idempotency_key"]}, {"_id": 0})
+        doc.pop("_id", None)
+        self._wakeup.set()
+        return doc
+
+    async def enqueue_many(self, docs: List[Dict[str, Any]]) -> int:
+        """Bulk-insert documents from build(); ones whose idempotency key already exists are skipped"""
+        from pymongo.errors import BulkWriteError
+
+        if not docs:
+            return 0
+        try:
+            result = await self.db.outbox.insert_many(docs, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as e:
+            inserted = e.details.get("nInserted", 0)
+        self._wakeup.set()
+        return inserted
+
+    async def enqueue_batch(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bulk-insert documents from build() of one tenant; returns each one's record in order,
+        the existing record where its idempotency key was already used"""
+        from pymongo.errors import BulkWriteError
+
+        if not docs:
+            return []
+        duplicates = set()
+        try:
+            await self.db.outbox.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+        self._wakeup.set()
+
+        existing = {}
+        if duplicates:
+            keys = [docs[i]["idempotency_key"] for i in duplicates]
+            cursor = self.db.outbox.find({"tenant_id": docs[0]["tenant_id"], "idempotency_key": {"$in": keys}}, {"_id": 0})
+            existing = {record["idempotency_key"]: record async for record in cursor}
+        records = []
+        for i, doc in enumerate(docs):
+            doc.pop("_id", None)
+            records.append(existing.get(doc["idempotency_key"], doc) if i in duplicates else doc)
+        return records
+
+    async def get(self, tenant_id: str, outbox_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.outbox.find_one({"id": outbox_id, "tenant_id": tenant_id}, {"_id": 0})
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Outbox started with {self.workers} workers")
+
+    async def stop(self):
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def pause(self, tenant_id: str, until: datetime):
+        """Hold back every message of a tenant until the given time"""
+        self._paused[tenant_id] = max(until, as_utc(self._paused.get(tenant_id, until)))
+        await self.db.outbox_pauses.update_one(
+            {"tenant_id": tenant_id}, {"$max": {"paused_until": until}}, upsert=True
+        )
+
+    async def _paused_tenants(self, now: datetime) -> List[str]:
+        loop_time = asyncio.get_running_loop().time()
+        if loop_time - self._paused_read_at >= OUTBOX_PAUSE_REFRESH_SECONDS:
+            self._paused_read_at = loop_time
+            cursor = self.db.outbox_pauses.find({"paused_until": {"$gt": now}}, {"_id": 0, "tenant_id": 1, "paused_until": 1})
+            self._paused = {pause["tenant_id"]: pause["paused_until"] async for pause in cursor}
+        return [tenant_id for tenant_id, until in self._paused.items() if as_utc(until) > now]
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        from pymongo import ReturnDocument
+
+        now = datetime.now(timezone.utc)
+        query: Dict[str, Any] = {"status": {"$in": PENDING_STATUSES}, "next_attempt_at": {"$lte": now}}
+        paused = await self._paused_tenants(now)
+        if paused:
+            query["tenant_id"] = {"$nin": paused}
+        return await self.db.outbox.find_one_and_update(
+            query,
+            {"$set": {"status": "sending", "next_attempt_at": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _worker(self, number: int):
+        while not self._stopping:
+            try:
+                message = await self._claim()
+            except Exception as e:
+                logger.error(f"Outbox worker {number} claim failed: {str(e)}")
+                message = None
+                await asyncio.sleep(OUTBOX_IDLE_POLL_SECONDS)
+
+            if message is None:
+                # Sleep until something is enqueued, or poll for retries coming due
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_IDLE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._deliver(message)
+            except Exception as e:
+                # The lease runs out and the message is claimed again
+                logger.error(f"Outbox worker {number} failed delivering {message['id']}: {str(e)}")
+
+    async def _deliver(self, message: Dict[str, Any]):
+        now = datetime.now(timezone.utc)
+        try:
+            config = await self.get_config(message["tenant_id"])
+            if not config:
+                raise GraphAPIError(400, "WhatsApp API not configured")
+            result = await graph_api.send_message(config, {"to": message["to"], **message["payload"]})
+        except Exception as e:
+            if not isinstance(e, GraphAPIError):
+                logger.error(f"Outbox delivery error for {message['id']}: {str(e)}")
+                e = GraphAPIError(500, str(e))
+            if e.is_retryable and message["attempts"] < OUTBOX_MAX_ATTEMPTS:
+                delay = backoff_delay(message["attempts"], e)
+                update = {"status": "queued", "next_attempt_at": now + timedelta(seconds=delay), "last_error": str(e)}
+                if e.is_rate_limit:
+                    await self.pause(message["tenant_id"], now + timedelta(seconds=delay))
+            else:
+                update = {"status": "failed", "next_attempt_at": None, "last_error": str(e)}
+            await self.db.outbox.update_one({"id": message["id"]}, {"$set": update})
+            return
+
+        wamid = (result.get("messages") or [{}])[0].get("id")
+        await self.db.outbox.update_one(
+            {"id": message["id"]},
+            {"$set": {"status": "sent", "wamid": wamid, "sent_at": now, "next_attempt_at": None, "last_error": None}}
+        )
+        if self.on_sent:
+            self.on_sent(message)
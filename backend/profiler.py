@@ -0,0 +1,149 @@
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+PROFILER_SAMPLE_RATE = float(os.environ.get("PROFILER_SAMPLE_RATE", "0"))
+PROFILER_SLOW_MS = float(os.environ.get("PROFILER_SLOW_MS", "0"))
+PROFILER_INTERVAL_MS = float(os.environ.get("PROFILER_INTERVAL_MS", "5"))
+PROFILER_BUFFER_SIZE = int(os.environ.get("PROFILER_BUFFER_SIZE", "50"))
+PROFILER_MAX_STACK_DEPTH = 64
+DEBUG_HEADER = b"x-debug-profile"
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Background thread that periodically snapshots one thread's Python stack.
+
+    Only samples while at least one request is being profiled, and keeps a bounded
+    window of (timestamp, stack) pairs that requests slice on completion. Everything
+    on the event loop thread is sampled, so concurrent requests share each other's
+    samples; that's the price of not instrumenting every coroutine.
+    """
+
+    def __init__(self, interval: float, window_seconds: float = 120.0):
+        self.interval = interval
+        self.samples = deque(maxlen=max(1, int(window_seconds / interval)))
+        self.target_thread_id: Optional[int] = None
+        self.active = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def acquire(self, thread_id: int):
+        with self._lock:
+            self.target_thread_id = thread_id
+            self.active += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            if not self.active or self.target_thread_id is None:
+                continue
+            frame = sys._current_frames().get(self.target_thread_id)
+            stack = []
+            while frame is not None and len(stack) < PROFILER_MAX_STACK_DEPTH:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((time.monotonic(), ";".join(stack)))
+
+    def collect(self, start: float, end: float) -> Counter:
+        return Counter(stack for ts, stack in list(self.samples) if start <= ts <= end)
+
+
+class ProfileStore:
+    """Bounded ring buffer of captured request profiles"""
+
+    def __init__(self, size: int):
+        self._profiles = deque(maxlen=size)
+
+    def add(self, profile: Dict):
+        self._profiles.append(profile)
+
+    def list(self) -> List[Dict]:
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        for profile in self._profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+
+def collapsed_stacks(profile: Dict) -> str:
+    """Render a profile in collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+sampler = StackSampler(PROFILER_INTERVAL_MS / 1000)
+profile_store = ProfileStore(PROFILER_BUFFER_SIZE)
+
+
+class ProfilerMiddleware:
+    """ASGI middleware profiling a sample of /api requests, slow ones, and super_admin debug requests.
+
+    ``authorize_debug`` receives the Authorization header value and returns True if the
+    caller may force profiling with the X-Debug-Profile header.
+    """
+
+    def __init__(self, app, authorize_debug: Callable[[str], bool], path_prefix: str = "/api"):
+        self.app = app
+        self.authorize_debug = authorize_debug
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        reason = None
+        headers = dict(scope.get("headers") or [])
+        if DEBUG_HEADER in headers and self.authorize_debug(headers.get(b"authorization", b"").decode("latin-1")):
+            reason = "debug"
+        elif PROFILER_SAMPLE_RATE and random.random() < PROFILER_SAMPLE_RATE:
+            reason = "sampled"
+        elif not PROFILER_SLOW_MS:
+            await self.app(scope, receive, send)
+            return
+
+        sampler.acquire(threading.get_ident())
+        started_at = datetime.now(timezone.utc)
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end = time.monotonic()
+            sampler.release()
+            duration_ms = (end - start) * 1000
+            if reason is None and duration_ms >= PROFILER_SLOW_MS:
+                reason = "slow"
+            if reason:
+                route = scope.get("route")
+                stacks = sampler.collect(start, end)
+                profile_store.add({
+                    "id": str(uuid.uuid4()),
+                    "reason": reason,
+                    "method": scope.get("method"),
+                    "path": scope["path"],
+                    "route": getattr(route, "path", None),
+                    "started_at": started_at.isoformat(),
+                    "duration_ms": round(duration_ms, 2),
+                    "sample_count": sum(stacks.values()),
+                    "stacks": stacks,
+                })
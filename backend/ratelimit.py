@@ -0,0 +1,235 @@
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_PLAN = "standard"
+# plan -> rule -> (burst capacity, sustained requests per minute)
+PLAN_LIMITS: Dict[str, Dict[str, Tuple[float, float]]] = {
+    "free": {"ai_reply": (5, 10), "whatsapp_send": (10, 30), "bulk_upload": (1, 2), "batch": (2, 4), "api": (60, 300)},
+    "standard": {"ai_reply": (20, 60), "whatsapp_send": (60, 300), "bulk_upload": (3, 6), "batch": (10, 30), "api": (200, 1200)},
+    "enterprise": {"ai_reply": (60, 300), "whatsapp_send": (300, 1800), "bulk_upload": (10, 30), "batch": (30, 120), "api": (1000, 6000)},
+}
+if os.environ.get("RATE_LIMIT_PLANS"):
+    PLAN_LIMITS = {
+        plan: {rule: tuple(limit) for rule, limit in rules.items()}
+        for plan, rules in json.loads(os.environ["RATE_LIMIT_PLANS"]).items()
+    }
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() != "false"
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_IDLE_SECONDS = float(os.environ.get("RATE_LIMIT_IDLE_SECONDS", "600"))
+PLAN_CACHE_TTL = float(os.environ.get("PLAN_CACHE_TTL_SECONDS", "60"))
+
+
+class Rule:
+    """An expensive endpoint: requests matching method and path draw from the tenant's bucket for name.
+
+    Endpoints that are only expensive with certain options (an AI reply from send_message)
+    are charged by their handler with charge() instead.
+    """
+
+    def __init__(self, name: str, method: str, path: str):
+        self.name = name
+        self.method = method
+        self.path = re.compile(path + "$")
+
+    def matches(self, method: str, path: str) -> bool:
+        return method == self.method and self.path.match(path) is not None
+
+
+RULES: List[Rule] = [
+    Rule("whatsapp_send", "POST", r"/api/whatsapp/send"),
+    Rule("bulk_upload", "POST", r"/api/contacts/bulk-upload"),
+    Rule("batch", "POST", r"/api/(contacts/batch|whatsapp/send/batch)"),
+    Rule("batch", "PUT", r"/api/users/permissions/batch"),
+]
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class RateLimiter:
+    """Token buckets keyed by (tenant, rule), least recently used first.
+
+    Each key costs one small bucket. A bucket untouched for ``idle_seconds`` has
+    refilled completely, so dropping it loses nothing; those are evicted from the
+    front on every call, and ``max_keys`` bounds memory if traffic comes from more
+    keys than that within the idle window. Limits are per process: with several
+    workers a tenant gets each worker's allowance.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS, idle_seconds: float = RATE_LIMIT_IDLE_SECONDS):
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def check(self, key: Tuple[str, str], capacity: float, per_minute: float, now: Optional[float] = None, tokens: float = 1) -> float:
+        """Like acquire() but without taking anything, to test several buckets before drawing from any"""
+        now = time.monotonic() if now is None else now
+        rate = per_minute / 60.0
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(capacity, now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        self._evict(now)
+
+        if bucket.tokens >= tokens:
+            return 0.0
+        if tokens > capacity:
+            return math.inf
+        return (tokens - bucket.tokens) / rate if rate > 0 else self.idle_seconds
+
+    def acquire(self, key: Tuple[str, str], capacity: float, per_minute: float, now: Optional[float] = None, tokens: float = 1) -> float:
+        """Take tokens; returns 0 if allowed, otherwise the seconds until they are available (inf if never)"""
+        wait = self.check(key, capacity, per_minute, now, tokens)
+        if not wait:
+            self._buckets[key].tokens -= tokens
+        return wait
+
+    def _evict(self, now: float):
+        while self._buckets:
+            key, oldest = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_keys and now - oldest.updated < self.idle_seconds:
+                break
+            self._buckets.popitem(last=False)
+
+
+class PlanCache:
+    """Plan of each tenant, cached for PLAN_CACHE_TTL seconds so limiting costs no reads on the hot path"""
+
+    def __init__(self, db, ttl: float = PLAN_CACHE_TTL):
+        self.db = db
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, tenant_id: str) -> str:
+        now = time.monotonic()
+        entry = self._entries.get(tenant_id)
+        if entry and entry[0] > now:
+            return entry[1]
+        tenant = await self.db.tenants.find_one({"id": tenant_id}, {"_id": 0, "plan": 1})
+        plan = (tenant or {}).get("plan") or DEFAULT_PLAN
+        self._entries[tenant_id] = (now + self.ttl, plan)
+        return plan
+
+    def invalidate(self, tenant_id: str):
+        self._entries.pop(tenant_id, None)
+
+
+def limits_for(plan: str) -> Dict[str, Tuple[float, float]]:
+    return PLAN_LIMITS.get(plan) or PLAN_LIMITS[DEFAULT_PLAN]
+
+
+def charge(limiter: RateLimiter, key: str, plan: str, rule: str, tokens: int) -> Optional[Tuple[str, Dict[str, str]]]:
+    """Draw tokens for a request that costs more than one, e.g. one token per recipient of a batch send.
+
+    For handlers to call once they know the cost. Returns None if allowed, otherwise
+    the detail and headers of a 429; a cost above the bucket's capacity can never be
+    covered and says so instead of suggesting a retry.
+    """
+    limits = limits_for(plan)
+    if not RATE_LIMIT_ENABLED or rule not in limits:
+        return None
+    capacity, per_minute = limits[rule]
+    wait = limiter.acquire((key, rule), capacity, per_minute, tokens=tokens)
+    if not wait:
+        return None
+    if math.isinf(wait):
+        return f"At most {int(capacity)} {rule} per request on the {plan} plan", {"RateLimit-Limit": str(int(capacity))}
+    headers = {name.decode(): value.decode() for name, value in limit_headers(wait, capacity)}
+    return f"Rate limit exceeded for {rule}, retry in {headers['retry-after']}s", headers
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-tenant limits to /api requests.
+
+    ``identify`` receives the Authorization header value and returns the key to limit
+    on (the tenant, or the user for accounts without one) or None; unauthenticated
+    requests pass through and are rejected by the route. Every request draws from
+    the "api" bucket and requests matching a Rule also from that rule's bucket;
+    tokens are only taken once every bucket has them, so a rejected request costs
+    nothing. Limited requests get 429 with Retry-After.
+    """
+
+    def __init__(
+        self,
+        app,
+        identify: Callable[[str], Optional[Tuple[str, Optional[str]]]],
+        plans: Callable[[str], Awaitable[str]],
+        limiter: Optional[RateLimiter] = None,
+        rules: List[Rule] = RULES,
+        path_prefix: str = "/api",
+    ):
+        self.app = app
+        self.identify = identify
+        self.plans = plans
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.rules = rules
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT_ENABLED or scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        identity = self.identify(headers.get(b"authorization", b"").decode("latin-1"))
+        if identity is None:
+            await self.app(scope, receive, send)
+            return
+        key, tenant_id = identity
+
+        rule_names = ["api"]
+        for rule in self.rules:
+            if rule.matches(scope["method"], scope["path"]):
+                rule_names.append(rule.name)
+                break
+
+        limits = limits_for(await self.plans(tenant_id) if tenant_id else DEFAULT_PLAN)
+        buckets = [(name, limits[name]) for name in rule_names if name in limits]
+        now = time.monotonic()
+        for name, (capacity, per_minute) in buckets:
+            wait = self.limiter.check((key, name), capacity, per_minute, now)
+            if wait:
+                await reject(send, name, wait, capacity)
+                return
+        for name, (capacity, per_minute) in buckets:
+            self.limiter.acquire((key, name), capacity, per_minute, now)
+        await self.app(scope, receive, send)
+
+
+def limit_headers(wait: float, capacity: float) -> List[Tuple[bytes, bytes]]:
+    return [
+        (b"retry-after", str(max(1, math.ceil(wait))).encode()),
+        (b"ratelimit-limit", str(int(capacity)).encode()),
+        (b"ratelimit-remaining", b"0"),
+    ]
+
+
+async def reject(send, rule: str, wait: float, capacity: float):
+    headers = limit_headers(wait, capacity)
+    body = json.dumps({"detail": f"Rate limit exceeded for {rule}, retry in {headers[0][1].decode()}s"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ] + headers,
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_HORIZON = timedelta(seconds=int(os.environ.get("SCHEDULER_HORIZON_SECONDS", "600")))
+SCHEDULER_LEASE = timedelta(seconds=int(os.environ.get("SCHEDULER_LEASE_SECONDS", "900")))
+
+# Identifies this process when taking leases, so several replicas can share one database
+INSTANCE_ID = str(uuid.uuid4())
+
+
+def to_utc(value) -> datetime:
+    """Parse a stored timestamp (ISO string or datetime) as an aware UTC datetime"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def iso(value: datetime) -> str:
+    """Fixed-width UTC ISO timestamp so stored values compare correctly as strings (naive means UTC)"""
+    return to_utc(value).isoformat(timespec="microseconds")
+
+
+class CampaignScheduler:
+    """Starts scheduled campaigns at their due time.
+
+    Campaigns due within the horizon are kept in an in-memory min-heap keyed by
+    scheduled_at, and the loop sleeps until the earliest one is due (or until woken
+    by notify()). The heap is reloaded from the (status, scheduled_at) index every
+    half horizon to pick up campaigns scheduled through other replicas. Starting a
+    campaign means atomically moving it from scheduled to running with a lease, so
+    only one replica wins; a lease that expires (replica died mid-run) can be taken over.
+    """
+
+    def __init__(self, db, run_campaign: Callable[[Dict[str, Any]], Awaitable[None]]):
+        self.db = db
+        self.run_campaign = run_campaign
+        self._heap: List[Tuple[datetime, str]] = []
+        # campaign id -> due time of its live heap entry; entries it has superseded are skipped on pop
+        self._queued: Dict[str, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running = set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self, campaign: Dict[str, Any]):
+        """Tell the scheduler about a campaign scheduled by this process"""
+        if campaign.get("status") != "scheduled" or not campaign.get("scheduled_at"):
+            return
+        due = to_utc(campaign["scheduled_at"])
+        if due <= datetime.now(timezone.utc) + SCHEDULER_HORIZON:
+            self._push(due, campaign["id"])
+            self._wakeup.set()
+
+    def _push(self, due: datetime, campaign_id: str):
+        # A campaign moved earlier (e.g. "send now") gets a new entry; the later one goes stale
+        if campaign_id not in self._queued or due < self._queued[campaign_id]:
+            self._queued[campaign_id] = due
+            heapq.heappush(self._heap, (due, campaign_id))
+
+    async def _reload(self):
+        now = datetime.now(timezone.utc)
+        cursor = self.db.campaigns.find(
+            {"status": "scheduled", "scheduled_at": {"$lte": iso(now + SCHEDULER_HORIZON)}},
+            {"_id": 0, "id": 1, "scheduled_at": 1}
+        ).sort("scheduled_at", 1)
+        async for campaign in cursor:
+            self._push(to_utc(campaign["scheduled_at"]), campaign["id"])
+        # Runs whose replica died holding the lease
+        cursor = self.db.campaigns.find(
+            {"status": "running", "lease_expires_at": {"$lt": iso(now)}},
+            {"_id": 0, "id": 1, "scheduled_at": 1}
+        )
+        async for campaign in cursor:
+            self._push(now, campaign["id"])
+
+    async def _loop(self):
+        next_reload = datetime.now(timezone.utc)
+        while True:
+            try:
+                now = datetime.now(timezone.utc)
+                if now >= next_reload:
+                    await self._reload()
+                    next_reload = now + SCHEDULER_HORIZON / 2
+
+                while self._heap and self._heap[0][0] <= now:
+                    due, campaign_id = heapq.heappop(self._heap)
+                    if self._queued.get(campaign_id) != due:
+                        continue
+                    del self._queued[campaign_id]
+                    await self._start(campaign_id, now)
+
+                wake_at = min(self._heap[0][0], next_reload) if self._heap else next_reload
+                timeout = max(0.0, (wake_at - datetime.now(timezone.utc)).total_seconds())
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Campaign scheduler error: {str(e)}")
+                await asyncio.sleep(5)
+
+    async def _start(self, campaign_id: str, now: datetime):
+        from pymongo import ReturnDocument
+
+        campaign = await self.db.campaigns.find_one_and_update(
+            {
+                "id": campaign_id,
+                "$or": [
+                    {"status": "scheduled", "scheduled_at": {"$lte": iso(now)}},
+                    {"status": "running", "lease_expires_at": {"$lt": iso(now)}},
+                ]
+            },
+            {"$set": {
+                "status": "running",
+                "lease_owner": INSTANCE_ID,
+                "lease_expires_at": iso(now + SCHEDULER_LEASE),
+                "started_at": iso(now),
+            }},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if not campaign:
+            # Another replica took it, or it was rescheduled/cancelled
+            return
+        logger.info(f"Starting campaign {campaign_id}")
+        task = asyncio.create_task(self._execute(campaign))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _execute(self, campaign: Dict[str, Any]):
+        try:
+            await self.run_campaign(campaign)
+        except Exception as e:
+            logger.error(f"Campaign {campaign['id']} failed: {str(e)}")
+            await self.db.campaigns.update_one(
+                {"id": campaign["id"], "lease_owner": INSTANCE_ID},
+                {"$set": {"status": "failed", "error": str(e)}}
+            )
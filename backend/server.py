@@ -1,37 +1,83 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Header, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.encoders import jsonable_encoder
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from bson import ObjectId
+import asyncio
 import os
+import re
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
-try:
-    from emergentintegrations.llm.chat import LlmChat, UserMessage
-except ImportError:
-    class UserMessage:
-        def __init__(self, text: str):
-            self.text = text
-    class LlmChat:
-        def __init__(self, *args, **kwargs):
-            pass
-        async def send_message(self, *args, **kwargs):
-            return "AI response (fallback: emergentintegrations package not found)"
 import json
-import httpx
-from models import MetaAPIConfig, MessageTemplate, Permission, UserPermission, InviteUser
+from models import MetaAPIConfig, MessageTemplate, Permission, UserPermission, InviteUser, AudienceSegment, ContactBatch, SendBatch, PermissionBatch
 from permissions import get_default_permissions, has_permission
-import pandas as pd
+from loaders import BatchLoader, LoaderScopeMiddleware
+from indexes import ensure_indexes
+from metrics import MetricsMiddleware, render_metrics, track_outbound
+from profiler import ProfilerMiddleware, profile_store, collapsed_stacks
+from lazy import LazyObject, lazy_import
+import database
+from database import client, db, list_db, analytics_db, telemetry_db
+import graph_api
+from outbox import Outbox, public_view
+from scheduler import CampaignScheduler, iso
+from campaigns import run_campaign, audience_query
+from template_compiler import compile_template
+from template_sync import ApprovedTemplateCache, TemplateSync
+from contact_search import phone_digits, search_fields, search_query, encode_cursor, backfill_search_fields
+from message_search import highlight, search_pipeline, backfill_message_tenants
+from migrations import run_once
+from statuses import StatusTracker, status_events
+from archive import MessageArchiver, conversation_messages
+from conversations import advance_last_message, read_update, with_unread_count, backfill_last_messages
+from webhooks import RecentIds, TenantLookup, store_new, webhook_message_docs, append_to_conversations, stamp_webhook_received_at
+from blobstore import BlobStore
+from media import MediaFetcher
+from logos import MAX_LOGO_BYTES, decode_base64_logo, store_logo, migrate_logo_base64
+from ratelimit import PLAN_LIMITS, PlanCache, RateLimiter, RateLimitMiddleware, charge
+from usage import UsageLedger, report_pipeline, usage_periods
+from batches import check_size, check_unique, item_error, bulk_write_chunks, item_results
+from exports import CONTACT_COLUMNS, TRANSCRIPT_COLUMNS, contact_rows, transcript_rows, export_stream
 import io
 
+# Heavy dependencies are imported on first use so a cold start (e.g. a /api/ ping on
+# serverless) doesn't pay for them: pandas only for bulk upload
+pd = lazy_import("pandas")
+
+# The LLM SDK is resolved on the first AI reply, see get_llm_sdk()
+LlmChat = None
+UserMessage = None
+
+class FallbackUserMessage:
+    def __init__(self, text: str):
+        self.text = text
+
+class FallbackLlmChat:
+    def __init__(self, *args, **kwargs):
+        pass
+    async def send_message(self, *args, **kwargs):
+        return "AI response (fallback: emergentintegrations package not found)"
+
+def get_llm_sdk():
+    """Import the LLM SDK on first use, falling back to a stub when it isn't installed"""
+    global LlmChat, UserMessage
+    # Each name is resolved on its own so replacing just one of them (as tests do) keeps the other working
+    if LlmChat is None or UserMessage is None:
+        try:
+            from emergentintegrations.llm.chat import LlmChat as SdkLlmChat, UserMessage as SdkUserMessage
+        except ImportError:
+            SdkLlmChat, SdkUserMessage = FallbackLlmChat, FallbackUserMessage
+        LlmChat = LlmChat or SdkLlmChat
+        UserMessage = UserMessage or SdkUserMessage
+    return LlmChat, UserMessage
+
 # Custom JSON encoder for MongoDB ObjectId
 class CustomJSONEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -68,19 +114,44 @@ def serialize_doc(doc):
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ.get('MONGO_URL')
-if not mongo_url:
-    logging.warning("MONGO_URL not set, falling back to localhost for development")
-    mongo_url = 'mongodb://localhost:27017'
+# Batched by-key lookups shared across concurrent requests
+users_loader = BatchLoader(db, "users")
+conversations_loader = BatchLoader(db, "conversations")
+meta_configs_loader = BatchLoader(db, "meta_configs", key="tenant_id")
+
+# Daily and monthly per-tenant usage counters, for billing
+usage_ledger = UsageLedger(db)
+
+def record_sent(message: dict):
+    usage_ledger.record(message["tenant_id"], "outbound_messages")
+    if message.get("campaign_id"):
+        usage_ledger.record(message["tenant_id"], "campaign_sends")
+
+# Outbound WhatsApp messages are queued and delivered by background workers
+outbox = Outbox(db, meta_configs_loader.load, on_sent=record_sent)
+
+async def execute_campaign(campaign: dict):
+    await run_campaign(db, outbox, campaign)
+
+# Starts campaigns at their scheduled_at
+campaign_scheduler = CampaignScheduler(db, execute_campaign)
 
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'bantconfirm')]
+# Template statuses kept in line with Meta; approved lists cached per tenant
+approved_templates = ApprovedTemplateCache()
+template_sync = TemplateSync(db, approved_templates)
+
+# Content-addressed GridFS blobs: inbound media and tenant logos
+blob_store = BlobStore(db)
+
+# Per-tenant request limits on expensive endpoints, by the tenant's plan
+tenant_plans = PlanCache(db)
+rate_limiter = RateLimiter()
 
 app = FastAPI(title="BantConfirm WhatsApp Platform API")
 api_router = APIRouter(prefix="/api")
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = LazyObject(lambda: lazy_import("passlib.context").CryptContext(schemes=["bcrypt"], deprecated="auto"))
 
 SECRET_KEY = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
@@ -104,6 +175,7 @@ class Tenant(BaseModel):
     meta_verified: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     status: str = "active"
+    plan: str = "standard"
 
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -128,6 +200,7 @@ class Message(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     conversation_id: str
+    tenant_id: Optional[str] = None
     role: str
     content: str
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -143,6 +216,12 @@ class Conversation(BaseModel):
     status: str = "open"
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    last_message_preview: Optional[str] = None
+    last_message_at: Optional[str] = None
+    last_message_role: Optional[str] = None
+    # contact messages received, and how many of them each user has read
+    inbound_count: int = 0
+    read_counts: Dict[str, int] = {}
 
 class Chatbot(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -182,10 +261,14 @@ class Campaign(BaseModel):
     name: str
     message_template: str
     target_contacts: List[str] = []
+    audience: Optional[AudienceSegment] = None
+    audience_size: int = 0
     scheduled_at: Optional[datetime] = None
     status: str = "draft"
     sent_count: int = 0
     delivered_count: int = 0
+    read_count: int = 0
+    failed_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class LoginRequest(BaseModel):
@@ -222,7 +305,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await users_loader.load(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         return user
@@ -231,6 +314,30 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
+def is_super_admin_token(authorization: str) -> bool:
+    """Check a raw Authorization header for a valid super_admin token without a DB lookup"""
+    _, _, token = authorization.partition(" ")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return False
+    return payload.get("role") == "super_admin"
+
+def rate_limit_key(tenant_id: Optional[str], user_id: str) -> str:
+    return f"tenant:{tenant_id}" if tenant_id else f"user:{user_id}"
+
+def rate_limit_identity(authorization: str) -> Optional[tuple]:
+    """Rate limit key (the tenant, else the user) and tenant of a raw Authorization header; super_admins aren't limited"""
+    _, _, token = authorization.partition(" ")
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("role") == "super_admin" or not payload.get("sub"):
+        return None
+    tenant_id = payload.get("tenant_id")
+    return (rate_limit_key(tenant_id, payload["sub"]), tenant_id)
+
 @api_router.post("/auth/signup")
 async def signup(request: SignupRequest):
     existing = await db.users.find_one({"email": request.email})
@@ -275,14 +382,14 @@ async def login(request: LoginRequest):
 async def get_tenants(current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "super_admin":
         raise HTTPException(status_code=403, detail="Access denied")
-    tenants = await db.tenants.find({}, {"_id": 0}).to_list(1000)
+    tenants = await list_db.tenants.find({}, {"_id": 0, "logo_base64": 0}).to_list(1000)
     return tenants
 
 @api_router.get("/tenants/{tenant_id}")
 async def get_tenant(tenant_id: str, current_user: dict = Depends(get_current_user)):
     if current_user["role"] not in ["super_admin", "tenant_admin"] or (current_user.get("tenant_id") and current_user["tenant_id"] != tenant_id):
         raise HTTPException(status_code=403, detail="Access denied")
-    tenant = await db.tenants.find_one({"id": tenant_id}, {"_id": 0})
+    tenant = await db.tenants.find_one({"id": tenant_id}, {"_id": 0, "logo_base64": 0})
     if not tenant:
         raise HTTPException(status_code=404, detail="Tenant not found")
     return tenant
@@ -307,7 +414,11 @@ async def update_tenant_profile(
     update_data = {}
     if name: update_data["name"] = name
     if logo_url: update_data["logo_url"] = logo_url
-    if logo_base64: update_data["logo_base64"] = logo_base64
+    if logo_base64:
+        try:
+            update_data.update(await store_logo(blob_store, decode_base64_logo(logo_base64)))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     if primary_color: update_data["primary_color"] = primary_color
     if business_phone: update_data["business_phone"] = business_phone
     if business_email: update_data["business_email"] = business_email
@@ -320,12 +431,42 @@ async def update_tenant_profile(
     
     return {"message": "Tenant profile updated successfully"}
 
+@api_router.put("/tenants/{tenant_id}/plan")
+async def update_tenant_plan(tenant_id: str, plan: str, current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Access denied")
+    if plan not in PLAN_LIMITS:
+        raise HTTPException(status_code=400, detail=f"Unknown plan, expected one of: {', '.join(PLAN_LIMITS)}")
+    result = await db.tenants.update_one({"id": tenant_id}, {"$set": {"plan": plan}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Tenant not found")
+    tenant_plans.invalidate(tenant_id)
+    return {"message": "Tenant plan updated", "plan": plan}
+
+@api_router.post("/tenants/{tenant_id}/logo")
+async def upload_tenant_logo(tenant_id: str, file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "tenant_admin" or current_user.get("tenant_id") != tenant_id:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    data = await file.read(MAX_LOGO_BYTES + 1)
+    try:
+        logo = await store_logo(blob_store, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await db.tenants.update_one({"id": tenant_id}, {"$set": logo})
+    return logo
+
+@api_router.get("/logos/{sha256}")
+async def get_logo(sha256: str, range: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None)):
+    """Tenant logos and thumbnails; the URL is the content hash, so caches may keep them forever"""
+    return await blob_store.response(sha256, range, if_none_match, "public, max-age=31536000, immutable", kind="logo")
+
 @api_router.get("/whatsapp/accounts")
 async def get_whatsapp_accounts(current_user: dict = Depends(get_current_user)):
     query = {}
     if current_user.get("tenant_id"):
         query["tenant_id"] = current_user["tenant_id"]
-    accounts = await db.whatsapp_accounts.find(query, {"_id": 0}).to_list(1000)
+    accounts = await list_db.whatsapp_accounts.find(query, {"_id": 0}).to_list(1000)
     return accounts
 
 @api_router.post("/whatsapp/accounts")
@@ -351,70 +492,186 @@ async def get_conversations(current_user: dict = Depends(get_current_user)):
     if current_user["role"] == "agent":
         query["assigned_agent_id"] = current_user["id"]
     
-    conversations = await db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).to_list(1000)
-    return conversations
+    conversations = await list_db.conversations.find(query, {"_id": 0}).sort("updated_at", -1).to_list(1000)
+    return [with_unread_count(conversation, current_user["id"]) for conversation in conversations]
+
+def export_response(format: str, columns: List[str], rows, name: str):
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="Format must be csv or xlsx")
+    body, media_type = export_stream(format, columns, rows, name)
+    filename = f"{name}-{datetime.now(timezone.utc).strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@api_router.get("/conversations/export")
+async def export_conversations(format: str = "csv", conversation_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Download conversation transcripts, one row per message"""
+    query = {}
+    if current_user.get("tenant_id"):
+        query["tenant_id"] = current_user["tenant_id"]
+    if current_user["role"] == "agent":
+        query["assigned_agent_id"] = current_user["id"]
+    if conversation_id:
+        query["id"] = conversation_id
+    
+    return export_response(format, TRANSCRIPT_COLUMNS, transcript_rows(list_db, query), "transcripts")
+
+@api_router.get("/messages/search")
+async def search_messages(
+    q: str = Query(..., min_length=1),
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Conversations whose messages match q, best match first, each with a highlighted snippet"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    conversation_ids = None
+    if current_user["role"] == "agent":
+        assigned = await list_db.conversations.find(
+            {"tenant_id": current_user["tenant_id"], "assigned_agent_id": current_user["id"]}, {"_id": 0, "id": 1}
+        ).to_list(10000)
+        conversation_ids = [conversation["id"] for conversation in assigned]
+    
+    pipeline = search_pipeline(current_user["tenant_id"], q, (page - 1) * limit, limit, conversation_ids)
+    groups = await list_db.messages.aggregate(pipeline).to_list(limit + 1)
+    conversations = await asyncio.gather(*[conversations_loader.load(group["_id"]) for group in groups[:limit]])
+    
+    results = []
+    for group, conversation in zip(groups, conversations):
+        if not conversation:
+            continue
+        message = group["message"]
+        message["snippet"], message["highlights"] = highlight(message.pop("content") or "", q)
+        results.append({
+            "conversation": {key: conversation.get(key) for key in ("id", "contact_name", "contact_phone", "status", "updated_at")},
+            "score": group["score"],
+            "matches": group["matches"],
+            "message": message,
+        })
+    return {"results": results, "page": page, "has_more": len(groups) > limit}
+
+@api_router.get("/messages/{message_id}/media")
+async def get_message_media(
+    message_id: str,
+    range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Media attached to an inbound message, with byte-range support for audio/video seeking"""
+    message = await db.messages.find_one({"id": message_id}, {"_id": 0})
+    if not message or not message.get("media"):
+        raise HTTPException(status_code=404, detail="Media not found")
+    if current_user.get("tenant_id") and message.get("tenant_id") != current_user["tenant_id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    try:
+        media = await media_fetcher.get(message)
+    except graph_api.GraphAPIError as e:
+        raise HTTPException(status_code=502, detail=f"Media download failed: {str(e)}")
+    # Content-addressed, so the bytes behind this URL never change; private because it needs a token
+    return await blob_store.response(media["sha256"], range, if_none_match, "private, max-age=31536000, immutable")
 
 @api_router.get("/conversations/{conversation_id}/messages")
 async def get_messages(conversation_id: str, current_user: dict = Depends(get_current_user)):
-    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
+    conversation = await conversations_loader.load(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if current_user.get("tenant_id") and conversation["tenant_id"] != current_user["tenant_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    messages = await db.messages.find({"conversation_id": conversation_id}, {"_id": 0}).sort("timestamp", 1).to_list(1000)
-    return messages
+    return await conversation_messages(db, conversation)
+
+@api_router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(conversation_id: str, current_user: dict = Depends(get_current_user)):
+    """Mark everything the contact has sent so far as read by the current user"""
+    conversation = await conversations_loader.load(conversation_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    if current_user.get("tenant_id") and conversation["tenant_id"] != current_user["tenant_id"]:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    await db.conversations.update_one({"id": conversation_id}, read_update(current_user["id"], conversation.get("inbound_count", 0)))
+    return {"id": conversation_id, "unread_count": 0}
 
 @api_router.post("/conversations/{conversation_id}/messages")
 async def send_message(conversation_id: str, request: MessageRequest, current_user: dict = Depends(get_current_user)):
-    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0})
+    from pymongo import UpdateOne
+
+    conversation = await conversations_loader.load(conversation_id)
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if current_user.get("tenant_id") and conversation["tenant_id"] != current_user["tenant_id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
+    chatbot = None
+    if request.use_ai:
+        chatbot = await db.chatbots.find_one({"tenant_id": conversation["tenant_id"], "enabled": True}, {"_id": 0})
+    if chatbot:
+        # Only messages a chatbot will answer cost an AI reply; checked before anything is stored
+        limited = charge(
+            rate_limiter, rate_limit_key(current_user.get("tenant_id"), current_user["id"]),
+            await tenant_plans.get(conversation["tenant_id"]), "ai_reply", 1
+        )
+        if limited:
+            raise HTTPException(status_code=429, detail=limited[0], headers=limited[1])
+    
     user_message = Message(
         conversation_id=conversation_id,
+        tenant_id=conversation["tenant_id"],
         role="user",
         content=request.content
     )
     user_dict = user_message.model_dump()
     user_dict['timestamp'] = user_dict['timestamp'].isoformat()
     await db.messages.insert_one(user_dict)
+    usage_ledger.record(conversation["tenant_id"], "outbound_messages")
+    last_message = user_dict
     
     ai_response = None
-    if request.use_ai:
-        chatbot = await db.chatbots.find_one({"tenant_id": conversation["tenant_id"], "enabled": True}, {"_id": 0})
-        if chatbot:
-            try:
-                llm_client = LlmChat(
-                    api_key=EMERGENT_LLM_KEY,
-                    session_id=conversation_id,
-                    system_message=chatbot["system_prompt"]
-                )
-                
-                user_msg = UserMessage(text=request.content)
+    if chatbot:
+        try:
+            LlmChat, UserMessage = get_llm_sdk()
+            llm_client = LlmChat(
+                api_key=EMERGENT_LLM_KEY,
+                session_id=conversation_id,
+                system_message=chatbot["system_prompt"]
+            )
+            
+            user_msg = UserMessage(text=request.content)
+            usage_ledger.record(conversation["tenant_id"], "ai_calls")
+            with track_outbound("llm"):
                 response = await llm_client.send_message(user_message=user_msg)
-                ai_response = response
-                
-                ai_message = Message(
-                    conversation_id=conversation_id,
-                    role="assistant",
-                    content=ai_response
-                )
-                ai_dict = ai_message.model_dump()
-                ai_dict['timestamp'] = ai_dict['timestamp'].isoformat()
-                await db.messages.insert_one(ai_dict)
-            except Exception as e:
-                logger.error(f"AI response error: {str(e)}")
-                ai_response = "AI temporarily unavailable"
+            ai_response = response
+            
+            ai_message = Message(
+                conversation_id=conversation_id,
+                tenant_id=conversation["tenant_id"],
+                role="assistant",
+                content=ai_response
+            )
+            ai_dict = ai_message.model_dump()
+            ai_dict['timestamp'] = ai_dict['timestamp'].isoformat()
+            await db.messages.insert_one(ai_dict)
+            last_message = ai_dict
+        except Exception as e:
+            logger.error(f"AI response error: {str(e)}")
+            ai_response = "AI temporarily unavailable"
     
-    await db.conversations.update_one(
-        {"id": conversation_id},
-        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    # Replying counts as having read what the contact sent
+    await db.conversations.bulk_write([
+        UpdateOne(
+            {"id": conversation_id},
+            {
+                "$set": {"updated_at": datetime.now(timezone.utc).isoformat(), "cold": False},
+                **read_update(current_user["id"], conversation.get("inbound_count", 0)),
+            }
+        ),
+        advance_last_message(conversation_id, last_message["content"], last_message["timestamp"], last_message["role"]),
+    ], ordered=False)
     
     return serialize_doc({"user_message": user_dict, "ai_response": ai_response})
 
@@ -431,14 +688,22 @@ async def create_conversation(contact_phone: str, contact_name: str, current_use
     conv_dict = conversation.model_dump()
     conv_dict['created_at'] = conv_dict['created_at'].isoformat()
     conv_dict['updated_at'] = conv_dict['updated_at'].isoformat()
-    await db.conversations.insert_one(conv_dict)
-    return serialize_doc(conv_dict)
+    from pymongo.errors import DuplicateKeyError
+    try:
+        await db.conversations.insert_one(conv_dict)
+    except DuplicateKeyError:
+        # The contact already has an open conversation
+        existing = await db.conversations.find_one(
+            {"tenant_id": current_user["tenant_id"], "contact_phone": contact_phone, "status": "open"}, {"_id": 0}
+        )
+        return serialize_doc(with_unread_count(existing, current_user["id"]))
+    return serialize_doc(with_unread_count(conv_dict, current_user["id"]))
 
 @api_router.get("/chatbots")
 async def get_chatbots(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
-    chatbots = await db.chatbots.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
+    chatbots = await list_db.chatbots.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
     return chatbots
 
 @api_router.post("/chatbots")
@@ -461,9 +726,34 @@ async def create_chatbot(request: ChatbotRequest, current_user: dict = Depends(g
 async def get_contacts(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
-    contacts = await db.contacts.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
+    contacts = await list_db.contacts.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
     return contacts
 
+@api_router.get("/contacts/export")
+async def export_contacts(format: str = "csv", current_user: dict = Depends(get_current_user)):
+    """Download every contact of the tenant, streamed straight off the cursor"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    return export_response(format, CONTACT_COLUMNS, contact_rows(list_db, current_user["tenant_id"]), "contacts")
+
+@api_router.get("/contacts/search")
+async def search_contacts(q: str = "", limit: int = Query(25, ge=1, le=100), after: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Prefix search on contact name or phone number, paged with the returned next cursor"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    try:
+        query, field = search_query(current_user["tenant_id"], q, after)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    contacts = await list_db.contacts.find(query, {"_id": 0}).sort([(field, 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(contacts) > limit:
+        contacts = contacts[:limit]
+        next_cursor = encode_cursor(contacts[-1].get(field, ""), contacts[-1]["id"])
+    return {"contacts": contacts, "next": next_cursor}
+
 @api_router.post("/contacts/bulk-upload")
 async def bulk_upload_contacts(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
@@ -505,6 +795,7 @@ async def bulk_upload_contacts(file: UploadFile = File(...), current_user: dict
                 )
                 contact_dict = contact.model_dump()
                 contact_dict['created_at'] = contact_dict['created_at'].isoformat()
+                contact_dict.update(search_fields(contact_dict))
                 await db.contacts.insert_one(contact_dict)
                 contacts_added += 1
             
@@ -512,6 +803,7 @@ async def bulk_upload_contacts(file: UploadFile = File(...), current_user: dict
                 logger.error(f"Error adding contact: {str(e)}")
                 contacts_skipped += 1
         
+        usage_ledger.record(current_user["tenant_id"], "contacts_added", contacts_added)
         return {
             "message": "Bulk upload completed",
             "contacts_added": contacts_added,
@@ -527,11 +819,27 @@ async def get_approved_templates(current_user: dict = Depends(get_current_user))
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
     
-    templates = await db.templates.find({
-        "tenant_id": current_user["tenant_id"],
-        "status": "APPROVED"
-    }, {"_id": 0}).to_list(1000)
-    return templates
+    return await approved_templates.get(current_user["tenant_id"], load_approved_templates)
+
+async def load_approved_templates(tenant_id: str):
+    return await db.templates.find({"tenant_id": tenant_id, "status": "APPROVED"}, {"_id": 0}).to_list(1000)
+
+@api_router.post("/templates/sync")
+async def sync_templates(current_user: dict = Depends(get_current_user)):
+    """Pull this tenant's template statuses from Meta now"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    config = await meta_configs_loader.load(current_user["tenant_id"])
+    if not config:
+        raise HTTPException(status_code=400, detail="WhatsApp API not configured")
+    try:
+        updated = await template_sync.sync_tenant(config)
+    except graph_api.GraphAPIError as e:
+        raise HTTPException(status_code=502, detail=f"Template sync failed: {str(e)}")
+    return {"updated": updated}
+
+@api_router.post("/contacts")
 async def create_contact(phone_number: str, name: str, email: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
@@ -544,14 +852,78 @@ async def create_contact(phone_number: str, name: str, email: Optional[str] = No
     )
     contact_dict = contact.model_dump()
     contact_dict['created_at'] = contact_dict['created_at'].isoformat()
+    contact_dict.update(search_fields(contact_dict))
     await db.contacts.insert_one(contact_dict)
+    usage_ledger.record(current_user["tenant_id"], "contacts_added")
     return serialize_doc(contact_dict)
 
+@api_router.post("/contacts/batch")
+async def batch_contacts(batch: ContactBatch, current_user: dict = Depends(get_current_user)):
+    """Create or update many contacts; nothing is written unless every item is valid"""
+    from pymongo import InsertOne, UpdateOne
+
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    tenant_id = current_user["tenant_id"]
+    items = batch.contacts
+    errors = check_size("contacts", items)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    errors += check_unique("contacts", [(i, item.id) for i, item in enumerate(items)], "id")
+    errors += check_unique("contacts", [(i, None if item.id else item.phone_number) for i, item in enumerate(items)], "phone_number")
+    
+    projection = {"_id": 0, "id": 1, "phone_number": 1, "name": 1}
+    ids = [item.id for item in items if item.id]
+    phones = [item.phone_number for item in items if not item.id and item.phone_number]
+    by_id, by_phone = {}, {}
+    if ids:
+        by_id = {c["id"]: c for c in await db.contacts.find({"id": {"$in": ids}, "tenant_id": tenant_id}, projection).to_list(len(ids))}
+    if phones:
+        async for contact in db.contacts.find({"tenant_id": tenant_id, "phone_number": {"$in": phones}}, projection):
+            by_phone.setdefault(contact["phone_number"], contact)
+    
+    targets = {}
+    for i, item in enumerate(items):
+        if item.id:
+            if item.id not in by_id:
+                errors.append(item_error("contacts", i, "Contact not found", "id"))
+            targets[i] = by_id.get(item.id)
+        elif not item.phone_number:
+            errors.append(item_error("contacts", i, "id or phone_number is required"))
+        else:
+            targets[i] = by_phone.get(item.phone_number)
+            if not targets[i] and not item.name:
+                errors.append(item_error("contacts", i, "name is required to create a contact", "name"))
+    # An id and a phone_number item can still resolve to the same contact
+    errors += check_unique("contacts", [(i, target["id"]) for i, target in targets.items() if target], label="contact")
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    
+    operations, statuses = [], {}
+    for i, item in enumerate(items):
+        fields = item.model_dump(exclude_none=True, exclude={"id"})
+        target = targets[i]
+        if target:
+            update = {**fields, **search_fields({**target, **fields})}
+            operations.append((i, UpdateOne({"id": target["id"], "tenant_id": tenant_id}, {"$set": update})))
+            statuses[i] = {"status": "updated", "id": target["id"]}
+        else:
+            contact_dict = Contact(tenant_id=tenant_id, **fields).model_dump()
+            contact_dict['created_at'] = contact_dict['created_at'].isoformat()
+            contact_dict.update(search_fields(contact_dict))
+            operations.append((i, InsertOne(contact_dict)))
+            statuses[i] = {"status": "created", "id": contact_dict["id"]}
+    
+    write_errors = await bulk_write_chunks(db.contacts, operations)
+    created = sum(1 for i, result in statuses.items() if result["status"] == "created" and i not in write_errors)
+    usage_ledger.record(tenant_id, "contacts_added", created)
+    return item_results(list(range(len(items))), statuses, write_errors)
+
 @api_router.get("/campaigns")
 async def get_campaigns(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
-    campaigns = await db.campaigns.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
+    campaigns = await list_db.campaigns.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0, "target_contacts": 0}).to_list(1000)
     return campaigns
 
 @api_router.post("/campaigns")
@@ -559,7 +931,9 @@ async def create_campaign(
     name: str,
     message_template: str,
     template_id: Optional[str] = None,
-    target_contacts: List[str] = [],
+    target_contacts: List[str] = Query([]),
+    scheduled_at: Optional[datetime] = None,
+    audience: Optional[AudienceSegment] = None,
     current_user: dict = Depends(get_current_user)
 ):
     if not current_user.get("tenant_id"):
@@ -577,28 +951,60 @@ async def create_campaign(
         tenant_id=current_user["tenant_id"],
         name=name,
         message_template=message_template,
-        target_contacts=target_contacts
+        target_contacts=[] if audience else target_contacts,
+        audience=audience,
+        audience_size=await db.contacts.count_documents(audience_query(current_user["tenant_id"], audience.model_dump())) if audience else len(target_contacts),
+        scheduled_at=scheduled_at,
+        status="scheduled" if scheduled_at else "draft"
     )
     campaign_dict = campaign.model_dump()
     campaign_dict['created_at'] = campaign_dict['created_at'].isoformat()
     if campaign_dict.get('scheduled_at'):
-        campaign_dict['scheduled_at'] = campaign_dict['scheduled_at'].isoformat()
+        # Stored fixed-width in UTC so the scheduler can range-query it
+        campaign_dict['scheduled_at'] = iso(campaign_dict['scheduled_at'])
     
     if template_id:
         campaign_dict['template_id'] = template_id
     
     await db.campaigns.insert_one(campaign_dict)
+    campaign_scheduler.notify(campaign_dict)
+    campaign_dict.pop("target_contacts")
     return serialize_doc(campaign_dict)
 
+@api_router.post("/contacts/audience/count")
+async def count_audience(audience: AudienceSegment, current_user: dict = Depends(get_current_user)):
+    """Number of contacts an audience segment currently resolves to"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    count = await analytics_db.contacts.count_documents(audience_query(current_user["tenant_id"], audience.model_dump()))
+    return {"count": count}
+
+@api_router.post("/campaigns/{campaign_id}/send")
+async def send_campaign(campaign_id: str, current_user: dict = Depends(get_current_user)):
+    """Start a draft or scheduled campaign now"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    now = iso(datetime.now(timezone.utc))
+    result = await db.campaigns.update_one(
+        {"id": campaign_id, "tenant_id": current_user["tenant_id"], "status": {"$in": ["draft", "scheduled"]}},
+        {"$set": {"status": "scheduled", "scheduled_at": now}}
+    )
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="Campaign not found or already started")
+    
+    campaign_scheduler.notify({"id": campaign_id, "status": "scheduled", "scheduled_at": now})
+    return {"message": "Campaign started", "id": campaign_id}
+
 @api_router.get("/analytics/overview")
 async def get_analytics(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         return {"error": "Tenant ID required"}
     
-    total_conversations = await db.conversations.count_documents({"tenant_id": current_user["tenant_id"]})
-    total_messages = await db.messages.count_documents({"conversation_id": {"$exists": True}})
-    total_contacts = await db.contacts.count_documents({"tenant_id": current_user["tenant_id"]})
-    total_campaigns = await db.campaigns.count_documents({"tenant_id": current_user["tenant_id"]})
+    total_conversations = await analytics_db.conversations.count_documents({"tenant_id": current_user["tenant_id"]})
+    total_messages = await analytics_db.messages.count_documents({"conversation_id": {"$exists": True}})
+    total_contacts = await analytics_db.contacts.count_documents({"tenant_id": current_user["tenant_id"]})
+    total_campaigns = await analytics_db.campaigns.count_documents({"tenant_id": current_user["tenant_id"]})
     
     return {
         "total_conversations": total_conversations,
@@ -628,6 +1034,8 @@ async def save_meta_config(phone_number_id: str, business_account_id: str, acces
         {"$set": config_dict},
         upsert=True
     )
+    meta_configs_loader.clear(current_user["tenant_id"])
+    webhook_tenants.invalidate(phone_number_id)
     
     config_dict.pop("access_token")
     return config_dict
@@ -637,85 +1045,131 @@ async def get_meta_config(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
     
-    config = await db.meta_configs.find_one({"tenant_id": current_user["tenant_id"]}, {"_id": 0, "access_token": 0})
+    config = await meta_configs_loader.load(current_user["tenant_id"])
     if not config:
         return {"configured": False}
+    config.pop("access_token", None)
     
     return {"configured": True, **config}
 
-@api_router.post("/whatsapp/send")
-async def send_whatsapp_message(to: str, message: str, current_user: dict = Depends(get_current_user)):
-    """Send WhatsApp message via Meta Cloud API"""
+@api_router.post("/whatsapp/send", status_code=202)
+async def send_whatsapp_message(to: str, message: str, idempotency_key: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """Queue a WhatsApp message for delivery via Meta Cloud API"""
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
     
-    config = await db.meta_configs.find_one({"tenant_id": current_user["tenant_id"]}, {"_id": 0})
+    config = await meta_configs_loader.load(current_user["tenant_id"])
     if not config:
         raise HTTPException(status_code=400, detail="WhatsApp API not configured")
     
-    try:
-        url = f"https://graph.facebook.com/v18.0/{config['phone_number_id']}/messages"
-        headers = {
-            "Authorization": f"Bearer {config['access_token']}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "messaging_product": "whatsapp",
-            "to": to,
-            "type": "text",
-            "text": {"body": message}
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, headers=headers, json=payload, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
+    record = await outbox.enqueue(
+        current_user["tenant_id"],
+        to,
+        {"type": "text", "text": {"body": message}},
+        idempotency_key=idempotency_key,
+        created_by=current_user["id"]
+    )
+    return public_view(record)
+
+@api_router.post("/whatsapp/send/batch", status_code=202)
+async def send_whatsapp_batch(batch: SendBatch, idempotency_key: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    """Queue one WhatsApp message to many recipients; an Idempotency-Key covers every recipient of the batch"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
     
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
+    errors = check_size("to", batch.to)
+    if not batch.message.strip():
+        errors.append({"loc": ["body", "message"], "msg": "Message is empty", "type": "value_error"})
+    errors += [item_error("to", i, "Not a phone number") for i, to in enumerate(batch.to) if not phone_digits(to)]
+    errors += check_unique("to", [(i, phone_digits(to) or None) for i, to in enumerate(batch.to)])
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    
+    config = await meta_configs_loader.load(current_user["tenant_id"])
+    if not config:
+        raise HTTPException(status_code=400, detail="WhatsApp API not configured")
+    
+    # Each recipient costs a token from the single-send bucket, so batching doesn't get around the plan's send limit
+    limited = charge(
+        rate_limiter, rate_limit_key(current_user["tenant_id"], current_user["id"]),
+        await tenant_plans.get(current_user["tenant_id"]), "whatsapp_send", len(batch.to)
+    )
+    if limited:
+        raise HTTPException(status_code=429, detail=limited[0], headers=limited[1])
+    
+    payload = {"type": "text", "text": {"body": batch.message}}
+    records = await outbox.enqueue_batch([
+        Outbox.build(
+            current_user["tenant_id"], to, payload,
+            idempotency_key=f"{idempotency_key}:{to}" if idempotency_key else None,
+            created_by=current_user["id"]
+        )
+        for to in batch.to
+    ])
+    return item_results(list(range(len(records))), {i: public_view(record) for i, record in enumerate(records)}, {})
+
+@api_router.get("/whatsapp/outbox/{outbox_id}")
+async def get_outbox_message(outbox_id: str, current_user: dict = Depends(get_current_user)):
+    """Delivery status of a queued WhatsApp message"""
+    if not current_user.get("tenant_id"):
+        raise HTTPException(status_code=400, detail="Tenant ID required")
+    
+    record = await outbox.get(current_user["tenant_id"], outbox_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return public_view(record)
+
+# Message ids from recent deliveries, so Meta's retries are dropped without a database round trip
+recent_wamids = RecentIds()
+# phone_number_id -> tenant, for routing inbound messages
+webhook_tenants = TenantLookup(db)
+# Inbound media, copied out of the Graph API into the blob store
+media_fetcher = MediaFetcher(db, blob_store, meta_configs_loader.load)
+# Messages of long-idle conversations move to the compressed message_archive
+message_archiver = MessageArchiver(db)
+# Delivery/read receipts, applied in coalesced batches
+status_tracker = StatusTracker(db)
 
 @api_router.post("/whatsapp/webhook")
 async def whatsapp_webhook(request: dict):
     """Receive WhatsApp webhooks from Meta"""
     try:
         if request.get("object") == "whatsapp_business_account":
+            docs = []
             entries = request.get("entry", [])
             for entry in entries:
                 changes = entry.get("changes", [])
                 for change in changes:
                     value = change.get("value", {})
-                    messages = value.get("messages", [])
-                    
-                    for message in messages:
-                        phone_number = message.get("from")
-                        message_type = message.get("type")
-                        message_body = ""
-                        
-                        if message_type == "text":
-                            message_body = message.get("text", {}).get("body", "")
-                        
-                        await db.webhook_messages.insert_one({
-                            "phone_number": phone_number,
-                            "message_type": message_type,
-                            "message_body": message_body,
-                            "timestamp": datetime.now(timezone.utc).isoformat(),
-                            "raw_data": message
-                        })
+                    if change.get("field") == "message_template_status_update":
+                        await template_sync.apply_webhook(value)
+                        continue
+                    docs.extend(webhook_message_docs(value))
+                    status_tracker.add(status_events(value))
+            
+            # The whole delivery is stored, deduplicated and appended to conversations in bulk
+            stored = await store_new(telemetry_db, docs, recent_wamids)
+            for message in await append_to_conversations(db, webhook_tenants, stored):
+                usage_ledger.record(message["tenant_id"], "inbound_messages")
+                if message["media"]:
+                    media_fetcher.prefetch(message)
+            # Only now are retries of these messages safe to drop
+            recent_wamids.update(doc["wamid"] for doc in stored)
         
         return {"status": "received"}
     
     except Exception as e:
+        # A non-2xx answer makes Meta deliver again; appending is idempotent on wamid
         logger.error(f"Webhook processing error: {str(e)}")
-        return {"status": "error"}
+        return JSONResponse(status_code=500, content={"status": "error"})
 
 @api_router.get("/whatsapp/webhook")
 async def verify_webhook(mode: str = None, token: str = None, challenge: str = None):
     """Verify webhook for Meta"""
     if mode == "subscribe" and token:
-        configs = await db.meta_configs.find({}, {"_id": 0}).to_list(100)
-        for config in configs:
-            if token == config.get("webhook_verify_token"):
-                return int(challenge) if challenge else {"status": "verified"}
+        config = await db.meta_configs.find_one({"webhook_verify_token": token}, {"_id": 0, "tenant_id": 1})
+        if config:
+            return int(challenge) if challenge else {"status": "verified"}
     
     raise HTTPException(status_code=403, detail="Verification failed")
 
@@ -725,7 +1179,7 @@ async def get_templates(current_user: dict = Depends(get_current_user)):
     if not current_user.get("tenant_id"):
         raise HTTPException(status_code=400, detail="Tenant ID required")
     
-    templates = await db.templates.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
+    templates = await list_db.templates.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0}).to_list(1000)
     return templates
 
 @api_router.post("/templates")
@@ -737,6 +1191,7 @@ async def create_template(
     header_type: Optional[str] = None,
     header_content: Optional[str] = None,
     footer_text: Optional[str] = None,
+    variables: List[str] = Query([]),
     current_user: dict = Depends(get_current_user)
 ):
     if not current_user.get("tenant_id"):
@@ -753,25 +1208,28 @@ async def create_template(
         body_text=body_text,
         header_type=header_type,
         header_content=header_content,
-        footer_text=footer_text
+        footer_text=footer_text,
+        variables=variables
     )
+    compiled = compile_template(template.model_dump())
     
     template_dict = template.model_dump()
     template_dict['created_at'] = template_dict['created_at'].isoformat()
     await db.templates.insert_one(template_dict)
     
-    config = await db.meta_configs.find_one({"tenant_id": current_user["tenant_id"]}, {"_id": 0})
+    config = await meta_configs_loader.load(current_user["tenant_id"])
     if config:
         try:
-            url = f"https://graph.facebook.com/v18.0/{config['business_account_id']}/message_templates"
-            headers = {
-                "Authorization": f"Bearer {config['access_token']}",
-                "Content-Type": "application/json"
-            }
-            
+            # Meta requires a sample value for every placeholder
+            sample = {slot: fallback or field for slot, (field, fallback) in compiled.bindings.items()}
             components = [{"type": "BODY", "text": body_text}]
+            if compiled.body.slots:
+                components[0]["example"] = {"body_text": [[sample[slot] for slot in compiled.body.slots]]}
             if header_type and header_content:
-                components.insert(0, {"type": "HEADER", "format": header_type, "text": header_content})
+                header = {"type": "HEADER", "format": header_type, "text": header_content}
+                if compiled.header and compiled.header.slots:
+                    header["example"] = {"header_text": [sample[slot] for slot in compiled.header.slots]}
+                components.insert(0, header)
             if footer_text:
                 components.append({"type": "FOOTER", "text": footer_text})
             
@@ -782,14 +1240,14 @@ async def create_template(
                 "components": components
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, headers=headers, json=payload, timeout=30.0)
-                if response.status_code == 200:
-                    result = response.json()
-                    await db.templates.update_one(
-                        {"id": template.id},
-                        {"$set": {"meta_template_id": result.get("id"), "status": "PENDING"}}
-                    )
+            result = await graph_api.request(
+                "POST", f"/{config['business_account_id']}/message_templates", config["access_token"], json=payload
+            )
+            await db.templates.update_one(
+                {"id": template.id},
+                {"$set": {"meta_template_id": result.get("id"), "status": result.get("status", "PENDING")}}
+            )
+            approved_templates.invalidate(current_user["tenant_id"])
         
         except Exception as e:
             logger.error(f"Failed to submit template to Meta: {str(e)}")
@@ -805,7 +1263,7 @@ async def get_tenant_users(current_user: dict = Depends(get_current_user)):
     if current_user["role"] not in ["tenant_admin", "manager"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    users = await db.users.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0, "password_hash": 0}).to_list(1000)
+    users = await list_db.users.find({"tenant_id": current_user["tenant_id"]}, {"_id": 0, "password_hash": 0}).to_list(1000)
     return users
 
 @api_router.post("/users/invite")
@@ -855,7 +1313,7 @@ async def get_user_permissions(user_id: str, current_user: dict = Depends(get_cu
     
     perms = await db.user_permissions.find_one({"user_id": user_id}, {"_id": 0})
     if not perms:
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await users_loader.load(user_id)
         if user:
             return {"permissions": get_default_permissions(user["role"])}
     
@@ -878,6 +1336,38 @@ async def update_user_permissions(user_id: str, permissions: List[Permission], c
     
     return {"message": "Permissions updated successfully"}
 
+@api_router.put("/users/permissions/batch")
+async def update_permissions_batch(batch: PermissionBatch, current_user: dict = Depends(get_current_user)):
+    """Replace the permissions of many users; nothing is written unless every user belongs to the tenant"""
+    from pymongo import UpdateOne
+
+    if current_user["role"] != "tenant_admin" or not current_user.get("tenant_id"):
+        raise HTTPException(status_code=403, detail="Access denied")
+    tenant_id = current_user["tenant_id"]
+    updates = batch.updates
+    errors = check_size("updates", updates)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    errors += check_unique("updates", [(i, update.user_id) for i, update in enumerate(updates)], "user_id")
+    
+    user_ids = [update.user_id for update in updates]
+    known = {user["id"] for user in await db.users.find({"id": {"$in": user_ids}, "tenant_id": tenant_id}, {"_id": 0, "id": 1}).to_list(len(user_ids))}
+    errors += [item_error("updates", i, "User not found", "user_id") for i, update in enumerate(updates) if update.user_id not in known]
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+    
+    operations = [
+        (i, UpdateOne(
+            {"user_id": update.user_id, "tenant_id": tenant_id},
+            {"$set": {"permissions": [p.model_dump() for p in update.permissions]}},
+            upsert=True
+        ))
+        for i, update in enumerate(updates)
+    ]
+    write_errors = await bulk_write_chunks(db.user_permissions, operations)
+    statuses = {i: {"status": "updated", "user_id": update.user_id} for i, update in enumerate(updates)}
+    return item_results(list(range(len(updates))), statuses, write_errors)
+
 @api_router.delete("/users/{user_id}")
 async def delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
     if current_user["role"] != "tenant_admin" or not current_user.get("tenant_id"):
@@ -894,12 +1384,87 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
     
     return {"message": "User deleted successfully"}
 
+# Usage ledger
+USAGE_PERIOD = re.compile(r"\d{4}-\d{2}(-\d{2})?$")
+
+@api_router.get("/admin/usage")
+async def get_usage_report(
+    period: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_current_user)
+):
+    """Usage of every tenant for one day (YYYY-MM-DD) or month (YYYY-MM, default the current one), by tenant_id page"""
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Access denied")
+    period = period or usage_periods()[1]
+    if not USAGE_PERIOD.match(period):
+        raise HTTPException(status_code=400, detail="period must be YYYY-MM or YYYY-MM-DD")
+    rows = await analytics_db.usage_ledger.aggregate(report_pipeline(period, after, limit)).to_list(limit + 1)
+    next_after = rows[limit - 1]["tenant_id"] if len(rows) > limit else None
+    return {"period": period, "tenants": rows[:limit], "next": next_after}
+
+@api_router.get("/admin/usage/{tenant_id}")
+async def get_tenant_usage(
+    tenant_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    monthly: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """A tenant's daily (or monthly) usage rows between two periods, oldest first"""
+    if current_user["role"] not in ["super_admin", "tenant_admin"] or (current_user.get("tenant_id") and current_user["tenant_id"] != tenant_id):
+        raise HTTPException(status_code=403, detail="Access denied")
+    for value in (start, end):
+        if value and not USAGE_PERIOD.match(value):
+            raise HTTPException(status_code=400, detail="start and end must be YYYY-MM or YYYY-MM-DD")
+    # Month periods are 7 characters and day periods 10, and both sort as strings
+    period_filter = {"$regex": r"^\d{4}-\d{2}$" if monthly else r"^\d{4}-\d{2}-\d{2}$"}
+    if start:
+        period_filter["$gte"] = start
+    if end:
+        period_filter["$lte"] = end
+    return await analytics_db.usage_ledger.find(
+        {"tenant_id": tenant_id, "period": period_filter}, {"_id": 0}
+    ).sort("period", 1).to_list(1000)
+
+# Request profiles
+@api_router.get("/admin/profiles")
+async def get_profiles(current_user: dict = Depends(get_current_user)):
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Access denied")
+    return profile_store.list()
+
+@api_router.get("/admin/profiles/{profile_id}")
+async def get_profile(profile_id: str, current_user: dict = Depends(get_current_user)):
+    """Return a captured profile in collapsed-stack format, ready for flamegraph tools"""
+    if current_user["role"] != "super_admin":
+        raise HTTPException(status_code=403, detail="Access denied")
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed_stacks(profile))
+
+@api_router.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the database pool is warmed up and reachable"""
+    if not await database.check_ready():
+        return JSONResponse(status_code=503, content={"status": "unavailable"})
+    return {"status": "ready"}
+
 @api_router.get("/")
 async def root():
     return {"message": "BantConfirm WhatsApp Platform API", "version": "1.0.0"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.include_router(api_router)
 
+# Added before CORS so 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware, identify=rate_limit_identity, plans=tenant_plans.get, limiter=rate_limiter)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -907,6 +1472,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(LoaderScopeMiddleware)
+app.add_middleware(ProfilerMiddleware, authorize_debug=is_super_admin_token)
+app.add_middleware(MetricsMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -914,13 +1482,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Startup backfills run alongside traffic instead of holding up readiness
+background_jobs = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+
 @app.on_event("startup")
 async def startup():
-    await db.users.create_index("email", unique=True)
-    await db.conversations.create_index("tenant_id")
-    await db.messages.create_index("conversation_id")
+    await database.warm_up()
+    await ensure_indexes(db)
     logger.info("Database indexes created")
+    outbox.start()
+    campaign_scheduler.start()
+    template_sync.start()
+    status_tracker.start()
+    usage_ledger.start()
+    message_archiver.start()
+    run_in_background(run_once(db, "contacts_search_fields", lambda: backfill_search_fields(db)))
+    run_in_background(run_once(db, "messages_tenant_id", lambda: backfill_message_tenants(db)))
+    run_in_background(run_once(db, "tenant_logos_to_blobs", lambda: migrate_logo_base64(db, blob_store)))
+    run_in_background(run_once(db, "conversation_last_message", lambda: backfill_last_messages(db)))
+    run_in_background(run_once(telemetry_db, "webhook_messages_received_at", lambda: stamp_webhook_received_at(telemetry_db)))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await template_sync.stop()
+    await message_archiver.stop()
+    await media_fetcher.stop()
+    await status_tracker.stop()
+    await campaign_scheduler.stop()
+    await outbox.stop()
+    await usage_ledger.stop()
+    await graph_api.close()
+    database.close()
\ No newline at end of file
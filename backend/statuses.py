@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATUS_FLUSH_INTERVAL = float(os.environ.get("STATUS_FLUSH_INTERVAL_SECONDS", "2"))
+STATUS_FLUSH_MAX = int(os.environ.get("STATUS_FLUSH_MAX", "5000"))
+
+# Statuses only move forward. Meta can deliver them out of order (read before
+# delivered), and a failure after delivery is not one worth recording.
+RANK = {"queued": 0, "sending": 0, "sent": 1, "failed": 2, "delivered": 2, "read": 3}
+TRACKED = {"sent", "delivered", "read", "failed"}
+
+
+def event_time(status: Dict[str, Any]) -> datetime:
+    try:
+        return datetime.fromtimestamp(int(status["timestamp"]), tz=timezone.utc)
+    except (KeyError, TypeError, ValueError):
+        return datetime.now(timezone.utc)
+
+
+def status_events(value: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Status events (wamid, status, at, error) of one webhook change"""
+    events = []
+    for status in value.get("statuses", []):
+        if not status.get("id") or status.get("status") not in TRACKED:
+            continue
+        errors = status.get("errors") or [{}]
+        events.append({
+            "wamid": status["id"],
+            "status": status["status"],
+            "at": event_time(status),
+            "error": (errors[0].get("title") or errors[0].get("message")) if status["status"] == "failed" else None,
+        })
+    return events
+
+
+def counter_increments(old: str, new: str) -> Dict[str, int]:
+    """Campaign counters a message moving from old to new adds to"""
+    if new == "failed":
+        return {"failed_count": 1}
+    inc = {}
+    if RANK[old] < RANK["delivered"] <= RANK[new]:
+        inc["delivered_count"] = 1
+    if RANK[old] < RANK["read"] <= RANK[new]:
+        inc["read_count"] = 1
+    return inc
+
+
+class StatusTracker:
+    """Applies delivery/read statuses from webhooks to outbox records and campaigns.
+
+    Events are buffered in memory and flushed every STATUS_FLUSH_INTERVAL seconds (or
+    sooner once STATUS_FLUSH_MAX are waiting). A flush keeps only the furthest status
+    per wamid, applies them to the outbox with one bulk_write, and adds the resulting
+    transitions to campaign counters with one $inc per campaign, so a storm of read
+    receipts costs a handful of writes per interval rather than one per event.
+
+    Outbox updates are conditional on the status that was read, so a transition is
+    counted once even when replicas flush the same events concurrently. Events still
+    buffered when a process dies are lost; counters are a best-effort view.
+
+    Outbound WhatsApp messages only exist as outbox records (the only messages with a
+    wamid are inbound ones), so statuses aren't written to the messages collection.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, events: List[Dict[str, Any]]):
+        for event in events:
+            current = self._pending.get(event["wamid"])
+            if current is None or RANK[event["status"]] > RANK[current["status"]]:
+                self._pending[event["wamid"]] = event
+        if len(self._pending) >= STATUS_FLUSH_MAX:
+            self._full.set()
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=STATUS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await self.apply(pending)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to apply {len(pending)} message statuses: {str(e)}")
+
+    async def apply(self, pending: Dict[str, Dict[str, Any]]):
+        from pymongo import UpdateOne
+
+        records = await self.db.outbox.find(
+            {"wamid": {"$in": list(pending)}}, {"_id": 0, "wamid": 1, "status": 1, "campaign_id": 1}
+        ).to_list(len(pending))
+        transitions = [
+            (record, pending[record["wamid"]]) for record in records
+            if RANK[pending[record["wamid"]]["status"]] > RANK.get(record["status"], 0)
+        ]
+        if not transitions:
+            return
+
+        flush_id = str(uuid.uuid4())
+        result = await self.db.outbox.bulk_write([
+            UpdateOne(
+                {"wamid": record["wamid"], "status": record["status"]},
+                {"$set": {**self._fields(event, event["at"]), "status_flush_id": flush_id, **({"last_error": event["error"]} if event["error"] else {})}}
+            )
+            for record, event in transitions
+        ], ordered=False)
+        if result.modified_count < len(transitions):
+            # Some records changed since they were read; count only what this flush wrote
+            applied = set(await self.db.outbox.distinct(
+                "wamid", {"wamid": {"$in": [record["wamid"] for record, _ in transitions]}, "status_flush_id": flush_id}
+            ))
+            transitions = [(record, event) for record, event in transitions if record["wamid"] in applied]
+
+        increments = self.campaign_increments(transitions)
+        if increments:
+            await self.db.campaigns.bulk_write(
+                [UpdateOne({"id": campaign_id}, {"$inc": inc}) for campaign_id, inc in increments.items()], ordered=False
+            )
+
+    @staticmethod
+    def campaign_increments(transitions: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Dict[str, Dict[str, int]]:
+        increments: Dict[str, Dict[str, int]] = {}
+        for record, event in transitions:
+            if not record.get("campaign_id"):
+                continue
+            inc = increments.setdefault(record["campaign_id"], {})
+            for field, amount in counter_increments(record["status"], event["status"]).items():
+                inc[field] = inc.get(field, 0) + amount
+        return {campaign_id: inc for campaign_id, inc in increments.items() if inc}
+
+    @staticmethod
+    def _fields(event: Dict[str, Any], at: Any) -> Dict[str, Any]:
+        return {"status": event["status"], f"{event['status']}_at": at}
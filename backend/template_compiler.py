@@ -0,0 +1,91 @@
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+# Meta's positional placeholders: {{1}}, {{2}}, ...
+PLACEHOLDER = re.compile(r"\{\{\s*(\d+)\s*\}\}")
+
+
+def parse_variable(variable: str) -> Tuple[str, str]:
+    """Split a template variable spec "field|fallback" into the contact field and its fallback text"""
+    field, _, fallback = variable.partition("|")
+    return field.strip(), fallback.strip()
+
+
+class TextPlan:
+    """A piece of template text split once into literal chunks and placeholder slots"""
+
+    def __init__(self, text: str):
+        self.chunks: List[str] = []
+        self.slots: List[int] = []
+        position = 0
+        for match in PLACEHOLDER.finditer(text):
+            self.chunks.append(text[position:match.start()])
+            self.slots.append(int(match.group(1)))
+            position = match.end()
+        self.chunks.append(text[position:])
+
+
+class CompiledTemplate:
+    """Render plan for one message template.
+
+    The header and body are parsed once; rendering a batch of contacts then reads each
+    referenced contact field as a column and zips the columns into per-recipient
+    Graph API "components" parameters, without touching the template text again.
+    """
+
+    def __init__(self, name: str, language: str, header: Optional[str], body: str, variables: Tuple[str, ...]):
+        self.name = name.lower().replace(" ", "_")
+        self.language = language
+        self.header = TextPlan(header) if header else None
+        self.body = TextPlan(body)
+        slots = set(self.body.slots) | set(self.header.slots if self.header else [])
+        # Placeholder n takes variables[n - 1]; unmapped placeholders fall back to the contact's name
+        self.bindings: Dict[int, Tuple[str, str]] = {
+            slot: parse_variable(variables[slot - 1]) if slot <= len(variables) else ("name", "")
+            for slot in sorted(slots)
+        }
+        self.fields = sorted({field for field, _ in self.bindings.values()})
+
+    @property
+    def is_personalized(self) -> bool:
+        return bool(self.bindings)
+
+    def columns(self, contacts: List[Dict[str, Any]]) -> Dict[int, List[str]]:
+        """Placeholder values for a batch of contacts, one list per placeholder"""
+        columns = {}
+        for slot, (field, fallback) in self.bindings.items():
+            columns[slot] = [str(value) if value not in (None, "") else fallback for value in (c.get(field) for c in contacts)]
+        return columns
+
+    def render_batch(self, contacts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Graph API template payloads for a batch of contacts, in order"""
+        base = {"name": self.name, "language": {"code": self.language}}
+        if not self.is_personalized:
+            return [{"type": "template", "template": base} for _ in contacts]
+
+        columns = self.columns(contacts)
+        header_columns = [columns[slot] for slot in self.header.slots] if self.header else []
+        body_columns = [columns[slot] for slot in self.body.slots]
+        payloads = []
+        for i in range(len(contacts)):
+            components = []
+            if header_columns:
+                components.append({"type": "header", "parameters": [{"type": "text", "text": column[i]} for column in header_columns]})
+            if body_columns:
+                components.append({"type": "body", "parameters": [{"type": "text", "text": column[i]} for column in body_columns]})
+            payloads.append({"type": "template", "template": {**base, "components": components}})
+        return payloads
+
+
+@lru_cache(maxsize=512)
+def _compile(name: str, language: str, header: Optional[str], body: str, variables: Tuple[str, ...]) -> CompiledTemplate:
+    return CompiledTemplate(name, language, header, body, variables)
+
+
+def compile_template(template: Dict[str, Any]) -> CompiledTemplate:
+    """Cached render plan for a stored template; editing the template's text or variables compiles a new plan"""
+    header = template.get("header_content") if template.get("header_type") == "TEXT" else None
+    return _compile(
+        template["name"], template.get("language", "en_US"), header, template["body_text"], tuple(template.get("variables") or [])
+    )
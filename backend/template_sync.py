@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import graph_api
+from scheduler import INSTANCE_ID, iso
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SYNC_INTERVAL = float(os.environ.get("TEMPLATE_SYNC_INTERVAL_SECONDS", "900"))
+TEMPLATE_SYNC_PAGE_SIZE = int(os.environ.get("TEMPLATE_SYNC_PAGE_SIZE", "100"))
+TEMPLATE_CACHE_TTL = float(os.environ.get("TEMPLATE_CACHE_TTL_SECONDS", "60"))
+
+# Lease in job_leases that the replica running the periodic pull holds for one interval
+TEMPLATE_SYNC_LEASE = "template_sync"
+
+# Webhook events that don't name the resulting status directly
+EVENT_STATUSES = {"REINSTATED": "APPROVED"}
+
+
+def meta_name(name: str) -> str:
+    """Template name as submitted to Meta"""
+    return name.lower().replace(" ", "_")
+
+
+class ApprovedTemplateCache:
+    """Per-tenant approved template lists, dropped locally on any status change and expired after a TTL
+    so changes applied by other replicas show up too"""
+
+    def __init__(self, ttl: float = TEMPLATE_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, List[Dict[str, Any]]]] = {}
+
+    async def get(self, tenant_id: str, load: Callable[[str], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        entry = self._entries.get(tenant_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        templates = await load(tenant_id)
+        self._entries[tenant_id] = (time.monotonic() + self.ttl, templates)
+        return templates
+
+    def invalidate(self, tenant_id: str):
+        self._entries.pop(tenant_id, None)
+
+
+class TemplateSync:
+    """Keeps stored template statuses in line with Meta.
+
+    Status changes arrive as message_template_status_update webhooks. A periodic pull
+    per business account catches anything the webhooks missed: it pages through the
+    account's templates in bulk and applies every changed status in one bulk_write.
+    The pull takes a lease for the whole interval first, so it runs once per interval
+    across all replicas and restarts rather than on each of them.
+    """
+
+    def __init__(self, db, cache: ApprovedTemplateCache):
+        self.db = db
+        self.cache = cache
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self._acquire_lease():
+                    await self.sync_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Template sync error: {str(e)}")
+            await asyncio.sleep(TEMPLATE_SYNC_INTERVAL)
+
+    async def _acquire_lease(self) -> bool:
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches only an expired lease; otherwise the upsert collides with the live one
+            await self.db.job_leases.update_one(
+                {"id": TEMPLATE_SYNC_LEASE, "expires_at": {"$lte": iso(now)}},
+                {"$set": {"owner": INSTANCE_ID, "expires_at": iso(now + timedelta(seconds=TEMPLATE_SYNC_INTERVAL))}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def sync_all(self):
+        cursor = self.db.meta_configs.find({}, {"_id": 0, "tenant_id": 1, "business_account_id": 1, "access_token": 1})
+        async for config in cursor:
+            try:
+                await self.sync_tenant(config)
+            except graph_api.GraphAPIError as e:
+                logger.error(f"Template sync failed for tenant {config['tenant_id']}: {str(e)}")
+
+    async def fetch_statuses(self, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Every template on the business account, a page at a time"""
+        templates = []
+        params = {"fields": "id,name,language,status,rejected_reason", "limit": TEMPLATE_SYNC_PAGE_SIZE}
+        while True:
+            page = await graph_api.request(
+                "GET", f"/{config['business_account_id']}/message_templates", config["access_token"], params=params
+            )
+            templates.extend(page.get("data", []))
+            paging = page.get("paging", {})
+            after = paging.get("cursors", {}).get("after")
+            if not paging.get("next") or not after:
+                return templates
+            params = {**params, "after": after}
+
+    async def sync_tenant(self, config: Dict[str, Any]) -> int:
+        """Pull the tenant's template statuses from Meta and store the ones that changed; returns how many"""
+        from pymongo import UpdateOne
+
+        remote = await self.fetch_statuses(config)
+        by_id = {str(t["id"]): t for t in remote}
+        by_name = {(t.get("name"), t.get("language")): t for t in remote}
+
+        now = iso(datetime.now(timezone.utc))
+        operations = []
+        cursor = self.db.templates.find(
+            {"tenant_id": config["tenant_id"]},
+            {"_id": 0, "id": 1, "name": 1, "language": 1, "status": 1, "meta_template_id": 1}
+        )
+        async for template in cursor:
+            match = by_id.get(str(template.get("meta_template_id"))) or by_name.get((meta_name(template["name"]), template.get("language")))
+            if not match or (match.get("status") == template.get("status") and str(match["id"]) == template.get("meta_template_id")):
+                continue
+            operations.append(UpdateOne({"id": template["id"]}, {"$set": {
+                "status": match.get("status"),
+                "meta_template_id": str(match["id"]),
+                "rejected_reason": match.get("rejected_reason"),
+                "status_updated_at": now,
+            }}))
+
+        if operations:
+            await self.db.templates.bulk_write(operations, ordered=False)
+            self.cache.invalidate(config["tenant_id"])
+            logger.info(f"Updated {len(operations)} template statuses for tenant {config['tenant_id']}")
+        return len(operations)
+
+    async def apply_webhook(self, value: Dict[str, Any]):
+        """Apply a message_template_status_update webhook change"""
+        event = value.get("event")
+        template_id = value.get("message_template_id")
+        if not event or template_id is None:
+            return
+        template = await self.db.templates.find_one_and_update(
+            {"meta_template_id": str(template_id)},
+            {"$set": {
+                "status": EVENT_STATUSES.get(event, event),
+                "rejected_reason": value.get("reason"),
+                "status_updated_at": iso(datetime.now(timezone.utc)),
+            }},
+            projection={"_id": 0, "tenant_id": 1}
+        )
+        if template:
+            self.cache.invalidate(template["tenant_id"])
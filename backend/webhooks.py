@@ -0,0 +1,308 @@
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from conversations import advance_last_message
+from media import media_ref
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_DEDUP_SIZE = int(os.environ.get("WEBHOOK_DEDUP_SIZE", "50000"))
+TENANT_LOOKUP_TTL = float(os.environ.get("TENANT_LOOKUP_TTL_SECONDS", "300"))
+
+
+class RecentIds:
+    """Bounded set of recently seen ids, oldest evicted first.
+
+    Meta retries a delivery within minutes, so a retry almost always finds its
+    message ids here and is dropped without a round trip; anything older falls
+    through to the unique indexes. Ids are only added once their messages are on
+    their conversations, so a delivery that failed half-way is taken in again.
+    """
+
+    def __init__(self, maxlen: int = WEBHOOK_DEDUP_SIZE):
+        self.maxlen = maxlen
+        self._ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def __contains__(self, value: str) -> bool:
+        return value in self._ids
+
+    def add(self, value: str):
+        self._ids[value] = None
+        self._ids.move_to_end(value)
+        if len(self._ids) > self.maxlen:
+            self._ids.popitem(last=False)
+
+    def update(self, values: Iterable[Optional[str]]):
+        for value in values:
+            if value:
+                self.add(value)
+
+
+def message_body(message: Dict[str, Any]) -> str:
+    if message.get("type") == "text":
+        return message.get("text", {}).get("body", "")
+    media = media_ref(message)
+    return (media or {}).get("caption", "")
+
+
+def sent_at(message: Dict[str, Any]) -> str:
+    """When the contact sent the message (Meta gives epoch seconds), falling back to now"""
+    try:
+        return datetime.fromtimestamp(int(message["timestamp"]), tz=timezone.utc).isoformat()
+    except (KeyError, TypeError, ValueError):
+        return datetime.now(timezone.utc).isoformat()
+
+
+def webhook_message_docs(value: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """webhook_messages documents for the inbound messages of one webhook change"""
+    received_at = datetime.now(timezone.utc)
+    now = received_at.isoformat()
+    phone_number_id = value.get("metadata", {}).get("phone_number_id")
+    names = {contact.get("wa_id"): contact.get("profile", {}).get("name") for contact in value.get("contacts", [])}
+    return [{
+        "wamid": message.get("id"),
+        "phone_number_id": phone_number_id,
+        "phone_number": message.get("from"),
+        "contact_name": names.get(message.get("from")),
+        "message_type": message.get("type"),
+        "message_body": message_body(message),
+        "timestamp": now,
+        # BSON date for the retention TTL index
+        "received_at": received_at,
+        "raw_data": message,
+    } for message in value.get("messages", [])]
+
+
+async def store_new(db, docs: List[Dict[str, Any]], recent: RecentIds) -> List[Dict[str, Any]]:
+    """Store the raw payloads of documents not seen recently; returns the documents still to append.
+
+    Ids seen recently by this process are skipped outright. The rest go in one
+    unordered insert_many against the unique wamid index. A duplicate there was
+    stored by an earlier delivery or another replica, which may have failed before
+    appending it, so it is returned as well: appending is idempotent on wamid.
+    Any other write error is raised, for the delivery to be retried.
+    """
+    from pymongo.errors import BulkWriteError
+
+    fresh, batch_ids = [], set()
+    for doc in docs:
+        wamid = doc.get("wamid")
+        if wamid and (wamid in recent or wamid in batch_ids):
+            continue
+        batch_ids.add(wamid)
+        fresh.append(doc)
+    if not fresh:
+        return []
+
+    try:
+        await db.webhook_messages.insert_many(fresh, ordered=False)
+    except BulkWriteError as e:
+        failed = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+        if failed:
+            raise RuntimeError(f"Failed to store {len(failed)} webhook messages: {failed[0].get('errmsg')}")
+
+    for doc in fresh:
+        doc.pop("_id", None)
+    return fresh
+
+
+async def stamp_webhook_received_at(db) -> int:
+    """Give payloads stored before received_at existed one, so the retention TTL covers them (counting from now)"""
+    result = await db.webhook_messages.update_many(
+        {"received_at": {"$exists": False}}, {"$set": {"received_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count
+
+
+class TenantLookup:
+    """Maps the phone_number_id webhooks arrive on to the tenant that configured it.
+
+    Results (including "no such number") are cached for TENANT_LOOKUP_TTL seconds,
+    so steady webhook traffic costs no meta_configs reads at all.
+    """
+
+    def __init__(self, db, ttl: float = TENANT_LOOKUP_TTL):
+        self.db = db
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Optional[str]]] = {}
+
+    async def resolve(self, phone_number_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+        now = time.monotonic()
+        result, missing = {}, []
+        for phone_number_id in set(phone_number_ids):
+            entry = self._entries.get(phone_number_id)
+            if entry and entry[0] > now:
+                result[phone_number_id] = entry[1]
+            else:
+                missing.append(phone_number_id)
+        if missing:
+            configs = await self.db.meta_configs.find(
+                {"phone_number_id": {"$in": missing}}, {"_id": 0, "phone_number_id": 1, "tenant_id": 1}
+            ).to_list(len(missing))
+            found = {config["phone_number_id"]: config["tenant_id"] for config in configs}
+            for phone_number_id in missing:
+                result[phone_number_id] = found.get(phone_number_id)
+                self._entries[phone_number_id] = (now + self.ttl, result[phone_number_id])
+        return result
+
+    def invalidate(self, phone_number_id: str):
+        self._entries.pop(phone_number_id, None)
+
+
+def contact_phone(wa_id: str) -> str:
+    """Conversation contact_phone for a WhatsApp id (E.164 digits without the plus)"""
+    return wa_id if wa_id.startswith("+") else f"+{wa_id}"
+
+
+def message_content(doc: Dict[str, Any]) -> str:
+    return doc["message_body"] or f"[{doc.get('message_type')}]"
+
+
+async def upsert_open_conversations(db, keys: Dict[Tuple[str, str], Optional[str]], now: str):
+    """Make sure each (tenant_id, contact_phone) has an open conversation, in one bulk write.
+
+    keys maps each conversation to its contact name, used if it has to be created.
+    inbound_count and the last-message preview aren't folded into these upserts: the
+    messages need the conversation ids before they can be inserted, and which of them
+    are new (not a redelivery) is only known after that insert, so record_inbound
+    applies them in a second bulk write.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    operations = [
+        UpdateOne(
+            {"tenant_id": tenant_id, "contact_phone": phone, "status": "open"},
+            {
+                "$set": {"updated_at": now, "cold": False},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()), "contact_name": name or phone,
+                    "assigned_agent_id": None, "created_at": now,
+                },
+            },
+            upsert=True
+        )
+        for (tenant_id, phone), name in keys.items()
+    ]
+    try:
+        await db.conversations.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Two upserts racing for the same contact: the loser hits the unique open-conversation
+        # index, and re-running its update now matches the winner's document
+        retry = [operations[error["index"]] for error in e.details.get("writeErrors", []) if error.get("code") == 11000]
+        if len(retry) < len(e.details.get("writeErrors", [])):
+            raise
+        await db.conversations.bulk_write(retry, ordered=False)
+
+
+async def insert_new_messages(db, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert the messages whose wamid isn't on a conversation yet; returns those inserted.
+
+    One unordered bulk of upserts on the unique wamid index, so appending the same
+    webhook message twice (a retried delivery, or two replicas racing) adds it once.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    operations = [
+        UpdateOne({"wamid": message["wamid"]} if message.get("wamid") else {"id": message["id"]}, {"$setOnInsert": message}, upsert=True)
+        for message in messages
+    ]
+    try:
+        result = await db.messages.bulk_write(operations, ordered=False)
+        upserted = set(result.upserted_ids)
+    except BulkWriteError as e:
+        # The loser of a race for the same wamid hits the unique index; the winner inserted it
+        if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+            raise
+        upserted = {entry["index"] for entry in e.details.get("upserted", [])}
+    return [message for i, message in enumerate(messages) if i in upserted]
+
+
+async def record_inbound(db, messages: List[Dict[str, Any]]):
+    """Add newly appended contact messages to their conversations' inbound_count and last-message preview.
+
+    Runs after the messages are inserted: if it fails, the retried delivery finds them
+    appended and doesn't count them again, so an unread count can fall short but no
+    message is lost or counted twice.
+    """
+    from pymongo import UpdateOne
+
+    conversations: Dict[str, Dict[str, Any]] = {}
+    for message in messages:
+        entry = conversations.setdefault(message["conversation_id"], {"count": 0, "last": message})
+        entry["count"] += 1
+        if message["timestamp"] >= entry["last"]["timestamp"]:
+            entry["last"] = message
+    operations = []
+    for conversation_id, entry in conversations.items():
+        operations.append(UpdateOne({"id": conversation_id}, {"$inc": {"inbound_count": entry["count"]}}))
+        operations.append(advance_last_message(conversation_id, entry["last"]["content"], entry["last"]["timestamp"], "contact"))
+    await db.conversations.bulk_write(operations, ordered=False)
+
+
+async def append_to_conversations(db, tenants: TenantLookup, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn stored webhook messages into Messages on their tenant's open conversations.
+
+    Per webhook batch this is one cached tenant lookup, one conversation bulk upsert,
+    one read of the conversation ids per tenant, one bulk upsert of messages and one
+    bulk update of the conversations that gained any, however many messages the batch
+    carries. Messages already appended are skipped, so it can run again for a retried
+    delivery. Returns the messages added.
+    """
+    if not docs:
+        return []
+    tenant_ids = await tenants.resolve(doc["phone_number_id"] for doc in docs if doc.get("phone_number_id"))
+
+    keys: Dict[Tuple[str, str], Optional[str]] = {}
+    routed = []
+    for doc in docs:
+        tenant_id = tenant_ids.get(doc.get("phone_number_id"))
+        if not tenant_id or not doc.get("phone_number"):
+            logger.warning(f"No tenant for webhook message {doc.get('wamid')} on {doc.get('phone_number_id')}")
+            continue
+        key = (tenant_id, contact_phone(doc["phone_number"]))
+        keys[key] = keys.get(key) or doc.get("contact_name")
+        routed.append((key, doc))
+    if not routed:
+        return []
+
+    now = datetime.now(timezone.utc).isoformat()
+    await upsert_open_conversations(db, keys, now)
+
+    conversation_ids = {}
+    by_tenant: Dict[str, List[str]] = {}
+    for tenant_id, phone in keys:
+        by_tenant.setdefault(tenant_id, []).append(phone)
+    for tenant_id, phones in by_tenant.items():
+        cursor = db.conversations.find(
+            {"tenant_id": tenant_id, "contact_phone": {"$in": phones}, "status": "open"}, {"_id": 0, "id": 1, "contact_phone": 1}
+        )
+        async for conversation in cursor:
+            conversation_ids[(tenant_id, conversation["contact_phone"])] = conversation["id"]
+
+    messages = [{
+        "id": str(uuid.uuid4()),
+        "conversation_id": conversation_ids[key],
+        "tenant_id": key[0],
+        "role": "contact",
+        "content": message_content(doc),
+        "timestamp": sent_at(doc["raw_data"]),
+        "status": "received",
+        "media": media_ref(doc["raw_data"]),
+        # left out rather than null, which the unique sparse index would count as a value
+        **({"wamid": doc["wamid"]} if doc.get("wamid") else {}),
+    } for key, doc in routed if key in conversation_ids]
+    if not messages:
+        return []
+    added = await insert_new_messages(db, messages)
+    if added:
+        await record_inbound(db, added)
+    for message in added:
+        message.pop("_id", None)
+    return added
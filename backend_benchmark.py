@@ -0,0 +1,387 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+# Add backend directory to sys.path
+backend_path = str(Path(__file__).parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+BENCH_PASSWORD = "BenchPass123!"
+
+
+def use_in_memory_mongo():
+    """Swap Motor for mongomock-motor before the server module builds its client"""
+    try:
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        print("❌ --in-memory needs the mongomock-motor package (pip install mongomock-motor)")
+        sys.exit(2)
+    import motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+
+
+class StubUserMessage:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubLlmChat:
+    """Stands in for emergentintegrations' LlmChat with a fixed think time"""
+    latency = 0.0
+    reply = "Benchmark AI reply"
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def send_message(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.reply
+
+
+def graph_api_handler(latency):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(latency)
+        if request.url.path.endswith("/messages"):
+            return httpx.Response(200, json={"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]})
+        return httpx.Response(200, json={"id": uuid.uuid4().hex})
+    return handler
+
+
+def stub_external_services(server, llm_latency, graph_latency):
+    """Replace the LLM SDK and every outbound Graph API client with in-process stubs"""
+    import graph_api
+    StubLlmChat.latency = llm_latency
+    server.LlmChat, server.UserMessage = StubLlmChat, StubUserMessage
+    transport = httpx.MockTransport(graph_api_handler(graph_latency))
+    real_client = httpx.AsyncClient
+
+    class StubHttpx:
+        HTTPError = httpx.HTTPError
+
+        @staticmethod
+        def AsyncClient(*args, **kwargs):
+            kwargs["transport"] = transport
+            return real_client(*args, **kwargs)
+
+    graph_api.httpx = StubHttpx
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class WhatsAppPlatformBenchmark:
+    """Drives the hot endpoints of server.app in-process and records latency/throughput"""
+
+    def __init__(self, args):
+        self.args = args
+        self.server = None
+        self.client = None
+        self.tenants = []
+        self.results = {}
+
+    async def setup(self):
+        if self.args.in_memory:
+            use_in_memory_mongo()
+        os.environ.setdefault("DB_NAME", f"bantconfirm_bench_{uuid.uuid4().hex[:8]}")
+        # The benchmark drives each tenant far past its plan's limits on purpose
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+        import server
+        self.server = server
+        stub_external_services(server, self.args.llm_latency_ms / 1000, self.args.graph_latency_ms / 1000)
+        await server.startup()
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://bench", timeout=60.0)
+
+    async def teardown(self):
+        await self.client.aclose()
+        if not self.args.in_memory and not self.args.keep_data:
+            await self.server.client.drop_database(self.server.db.name)
+
+    async def seed(self):
+        """Create tenants through the API, then bulk-insert realistic volumes behind them"""
+        db = self.server.db
+        print(f"🌱 Seeding {self.args.tenants} tenants × {self.args.contacts} contacts / {self.args.conversations} conversations / {self.args.messages} messages each")
+        for t in range(self.args.tenants):
+            email = f"bench{t}-{uuid.uuid4().hex[:6]}@bench.example.com"
+            response = await self.client.post("/api/auth/signup", json={
+                "email": email, "password": BENCH_PASSWORD, "name": f"Bench Admin {t}", "tenant_name": f"Bench Tenant {t}"
+            })
+            response.raise_for_status()
+            body = response.json()
+            tenant_id = body["user"]["tenant_id"]
+            now = datetime.now(timezone.utc).isoformat()
+
+            await db.chatbots.insert_one({
+                "id": str(uuid.uuid4()), "tenant_id": tenant_id, "name": "Bench Bot",
+                "system_prompt": "You are a benchmark bot", "keywords": [], "enabled": True, "created_at": now
+            })
+            await db.meta_configs.insert_one({
+                "id": str(uuid.uuid4()), "tenant_id": tenant_id, "phone_number_id": f"pn{t}",
+                "business_account_id": f"waba{t}", "access_token": "bench-token",
+                "webhook_verify_token": f"verify{t}", "status": "active", "created_at": now
+            })
+            contacts = [{
+                "id": str(uuid.uuid4()), "tenant_id": tenant_id, "phone_number": f"+1555{t:03d}{i:07d}",
+                "name": f"Contact {i}", "email": None, "tags": ["bench"], "opted_in": True, "created_at": now
+            } for i in range(self.args.contacts)]
+            if contacts:
+                await db.contacts.insert_many(contacts)
+            conversation_ids = []
+            for c in range(self.args.conversations):
+                conversation_id = str(uuid.uuid4())
+                conversation_ids.append(conversation_id)
+                await db.conversations.insert_one({
+                    "id": conversation_id, "tenant_id": tenant_id, "contact_phone": f"+1555{t:03d}{c:07d}",
+                    "contact_name": f"Contact {c}", "assigned_agent_id": None, "status": "open",
+                    "created_at": now, "updated_at": now
+                })
+                messages = [{
+                    "id": str(uuid.uuid4()), "conversation_id": conversation_id, "tenant_id": tenant_id, "role": "user" if m % 2 else "assistant",
+                    "content": f"Benchmark message {m}", "timestamp": now, "status": "sent"
+                } for m in range(self.args.messages)]
+                if messages:
+                    await db.messages.insert_many(messages)
+
+            self.tenants.append({
+                "email": email, "tenant_id": tenant_id, "phone_number_id": f"pn{t}",
+                "headers": {"Authorization": f"Bearer {body['token']}"}, "conversation_ids": conversation_ids
+            })
+
+    # Scenarios: each takes the request index and returns an httpx response
+    async def login(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        return await self.client.post("/api/auth/login", json={"email": tenant["email"], "password": BENCH_PASSWORD})
+
+    async def conversation_list(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        return await self.client.get("/api/conversations", headers=tenant["headers"])
+
+    async def message_list(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        conversation_id = tenant["conversation_ids"][i % len(tenant["conversation_ids"])]
+        return await self.client.get(f"/api/conversations/{conversation_id}/messages", headers=tenant["headers"])
+
+    async def message_send(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        conversation_id = tenant["conversation_ids"][i % len(tenant["conversation_ids"])]
+        response = await self.client.post(
+            f"/api/conversations/{conversation_id}/messages",
+            json={"conversation_id": conversation_id, "content": f"Benchmark send {i}", "use_ai": True},
+            headers=tenant["headers"]
+        )
+        # The endpoint answers 200 with a fallback when the AI call fails; that run didn't measure the AI path
+        if response.status_code < 400 and response.json().get("ai_response") != StubLlmChat.reply:
+            raise RuntimeError(f"AI reply failed: {response.json().get('ai_response')!r}")
+        return response
+
+    async def webhook(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        payload = {
+            "object": "whatsapp_business_account",
+            "entry": [{"id": "bench", "changes": [{"field": "messages", "value": {
+                "messaging_product": "whatsapp",
+                "metadata": {"phone_number_id": tenant["phone_number_id"]},
+                "messages": [{
+                    "from": f"1555{i:07d}", "id": f"wamid.bench{i}-{uuid.uuid4().hex}",
+                    "timestamp": str(int(time.time())), "type": "text", "text": {"body": f"Inbound {i}"}
+                }]
+            }}]}]
+        }
+        return await self.client.post("/api/whatsapp/webhook", json=payload)
+
+    async def bulk_upload(self, i):
+        tenant = self.tenants[i % len(self.tenants)]
+        rows = ["name,phone_number,email"]
+        rows += [f"Upload {i}-{r},+1666{i:05d}{r:05d},upload{i}-{r}@bench.example.com" for r in range(self.args.upload_rows)]
+        files = {"file": (f"bench{i}.csv", io.BytesIO("\n".join(rows).encode()), "text/csv")}
+        return await self.client.post("/api/contacts/bulk-upload", files=files, headers=tenant["headers"])
+
+    def template_render(self):
+        """Render a personalized template for --render-recipients contacts in campaign-sized batches.
+
+        Not an HTTP scenario: it measures the per-batch CPU cost run_campaign pays before
+        enqueueing, so requests counts recipients and latencies are per batch.
+        """
+        from template_compiler import compile_template
+        template = {
+            "id": "bench-template", "name": "Bench Offer", "language": "en_US",
+            "header_type": "TEXT", "header_content": "Hi {{1}}",
+            "body_text": "Hello {{1}}, your code {{2}} is valid until {{3}}. Reply STOP to opt out, {{1}}.",
+            "variables": ["name|there", "phone_number", "email|next week"],
+        }
+        contacts = [
+            {"phone_number": f"+1777{r:07d}", "name": f"Contact {r}", "email": None if r % 3 else f"c{r}@bench.example.com"}
+            for r in range(self.args.render_recipients)
+        ]
+        batch_size = 500
+        latencies = []
+        rendered = 0
+        start = time.perf_counter()
+        for i in range(0, len(contacts), batch_size):
+            batch_start = time.perf_counter()
+            rendered += len(compile_template(template).render_batch(contacts[i:i + batch_size]))
+            latencies.append(time.perf_counter() - batch_start)
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "requests": rendered,
+            "errors": len(contacts) - rendered,
+            "concurrency": 1,
+            "throughput_rps": round(rendered / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        }
+        self.results["template_render"] = result
+        print(f"⏱  {'template_render':<18} {result['throughput_rps']:>9} rcpt/s  p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  per {batch_size}-recipient batch")
+        return result
+
+    async def run_scenario(self, name, scenario, requests):
+        latencies = []
+        errors = 0
+        counter = iter(range(requests))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    response = await scenario(i)
+                    if response.status_code >= 400:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+        elapsed = time.perf_counter() - start
+
+        result = {
+            "requests": requests,
+            "errors": errors,
+            "concurrency": self.args.concurrency,
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        }
+        self.results[name] = result
+        print(f"⏱  {name:<18} {result['throughput_rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  errors {errors}")
+        return result
+
+    async def run_all(self):
+        print("🚀 Starting WhatsApp Business Platform API Benchmark")
+        print(f"📍 Backend: {'in-memory Motor stand-in' if self.args.in_memory else os.environ.get('MONGO_URL', 'mongodb://localhost:27017')}")
+        print("=" * 60)
+        await self.setup()
+        try:
+            await self.seed()
+            scenarios = {
+                "login": (self.login, self.args.requests // 4 or 1),
+                "conversation_list": (self.conversation_list, self.args.requests),
+                "message_list": (self.message_list, self.args.requests),
+                "message_send": (self.message_send, self.args.requests),
+                "webhook": (self.webhook, self.args.requests),
+                "bulk_upload": (self.bulk_upload, max(1, self.args.requests // 20)),
+            }
+            selected = self.args.scenarios or list(scenarios) + ["template_render"]
+            for name in selected:
+                if name == "template_render":
+                    self.template_render()
+                    continue
+                scenario, requests = scenarios[name]
+                await self.run_scenario(name, scenario, requests)
+        finally:
+            await self.teardown()
+        return self.results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results, baseline_path, tolerance):
+    """Print deltas against a previous run; returns False if any p99 regressed beyond tolerance"""
+    baseline = json.loads(Path(baseline_path).read_text())["results"]
+    ok = True
+    print("\n📊 Compared with baseline " + baseline_path)
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        p99_change = (result["p99_ms"] - before["p99_ms"]) / before["p99_ms"] if before["p99_ms"] else 0.0
+        rps_change = (result["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] if before["throughput_rps"] else 0.0
+        regressed = p99_change > tolerance
+        ok = ok and not regressed
+        print(f"{'❌' if regressed else '✅'} {name:<18} p99 {p99_change:+.1%}  throughput {rps_change:+.1%}")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot API endpoints against a local mongod or in-memory stand-in")
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (login and bulk upload run fewer)")
+    parser.add_argument("--tenants", type=int, default=5)
+    parser.add_argument("--contacts", type=int, default=2000, help="contacts per tenant")
+    parser.add_argument("--conversations", type=int, default=200, help="conversations per tenant")
+    parser.add_argument("--messages", type=int, default=20, help="messages per conversation")
+    parser.add_argument("--upload-rows", type=int, default=500, help="rows per bulk upload file")
+    parser.add_argument("--render-recipients", type=int, default=100000, help="contacts rendered by the template_render scenario")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=0.0)
+    parser.add_argument("--scenarios", nargs="*", help="subset of scenarios to run")
+    parser.add_argument("--output", help="write results JSON here (default test_reports/benchmarks/<commit>.json)")
+    parser.add_argument("--baseline", help="results JSON from an earlier commit to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p99 regression before failing")
+    parser.add_argument("--keep-data", action="store_true", help="don't drop the benchmark database afterwards")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    benchmark = WhatsAppPlatformBenchmark(args)
+    results = asyncio.run(benchmark.run_all())
+
+    commit = git_commit()
+    output = Path(args.output or Path(__file__).parent / "test_reports" / "benchmarks" / f"{commit}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "results": results,
+    }, indent=2))
+    print(f"\n💾 Results written to {output}")
+
+    failed = [name for name, result in results.items() if result["errors"]]
+    if failed:
+        print(f"❌ Requests failed in: {', '.join(failed)}")
+        return 1
+
+    if args.baseline:
+        return 0 if compare(results, args.baseline, args.tolerance) else 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
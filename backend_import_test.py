@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+API_DIR = Path(__file__).parent / "api"
+
+# Must not be imported just to serve a cold request
+LAZY_MODULES = ["pandas", "numpy", "passlib", "bcrypt", "httpx", "emergentintegrations", "motor", "pymongo", "openpyxl", "PIL"]
+
+
+def measure_imports():
+    """Import the serverless entry point in a fresh interpreter and parse -X importtime output"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"],
+        cwd=API_DIR, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class ImportBudgetTester:
+    """Checks the cold-start import cost of api/index.py and reports it per module"""
+
+    def __init__(self, budget_ms, runs=3):
+        self.budget_ms = budget_ms
+        self.runs = runs
+        self.tests_run = 0
+        self.tests_passed = 0
+
+    def log_test(self, name, success, details=""):
+        """Log test result"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+            print(f"✅ {name} - PASSED")
+        else:
+            print(f"❌ {name} - FAILED: {details}")
+
+    def report(self, modules, top=20):
+        by_package = defaultdict(int)
+        for name, self_us, _ in modules:
+            by_package[name.split(".")[0]] += self_us
+
+        print(f"\n📦 Import cost by top-level package (self time, top {top})")
+        for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+            print(f"  {self_us / 1000:8.1f} ms  {package}")
+
+        print(f"\n🐢 Slowest individual modules (self time, top {top})")
+        for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[1])[:top]:
+            print(f"  {self_us / 1000:8.1f} ms  (cumulative {cumulative_us / 1000:8.1f} ms)  {name}")
+
+    def run_all_tests(self):
+        print("🚀 Measuring cold-start imports of api/index.py")
+        print("=" * 60)
+
+        # Take the fastest run so a noisy neighbour doesn't fail the budget
+        runs = [measure_imports() for _ in range(self.runs)]
+        totals = [next(cumulative for name, _, cumulative in modules if name == "index") for modules in runs]
+        best = runs[totals.index(min(totals))]
+        total_ms = min(totals) / 1000
+
+        self.report(best)
+        print("\n" + "=" * 60)
+
+        imported = {name for name, _, _ in best}
+        for module in LAZY_MODULES:
+            self.log_test(f"{module} not imported at startup", module not in imported, "imported eagerly")
+        self.log_test(f"Import time {total_ms:.1f} ms within {self.budget_ms} ms budget", total_ms <= self.budget_ms, f"{total_ms:.1f} ms")
+
+        print(f"\n📊 Test Results: {self.tests_passed}/{self.tests_run} tests passed")
+        return self.tests_passed == self.tests_run
+
+def main():
+    tester = ImportBudgetTester(float(os.environ.get("IMPORT_BUDGET_MS", "1000")))
+    success = tester.run_all_tests()
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
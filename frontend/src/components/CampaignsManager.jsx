@@ -94,19 +94,17 @@ export default function CampaignsManager({ user }) {
 
     try {
       const token = localStorage.getItem('token');
-      const contactIds = contacts.map(c => c.id);
-      
       const params = new URLSearchParams();
       params.append('name', formData.name);
       params.append('message_template', formData.message_template);
       if (formData.template_id) {
         params.append('template_id', formData.template_id);
       }
-      contactIds.forEach(id => params.append('target_contacts', id));
       
+      // Audience is resolved server-side when the campaign runs
       await axios.post(
         `${API}/campaigns?${params.toString()}`,
-        null,
+        { tags: [], opted_in_only: true },
         { headers: { Authorization: `Bearer ${token}` } }
       );
       
@@ -353,7 +351,7 @@ export default function CampaignsManager({ user }) {
                   )}
                   <div className="flex justify-between text-sm">
                     <span className="text-muted-foreground">Targets:</span>
-                    <span className="font-medium">{campaign.target_contacts?.length || 0}</span>
+                    <span className="font-medium">{campaign.audience_size || 0}</span>
                   </div>
                   <div className="flex justify-between text-sm">
                     <span className="text-muted-foreground">Sent:</span>
@@ -363,6 +361,16 @@ export default function CampaignsManager({ user }) {
                     <span className="text-muted-foreground">Delivered:</span>
                     <span className="font-medium">{campaign.delivered_count || 0}</span>
                   </div>
+                  <div className="flex justify-between text-sm">
+                    <span className="text-muted-foreground">Read:</span>
+                    <span className="font-medium">{campaign.read_count || 0}</span>
+                  </div>
+                  {campaign.failed_count > 0 && (
+                    <div className="flex justify-between text-sm">
+                      <span className="text-muted-foreground">Failed:</span>
+                      <span className="font-medium text-destructive">{campaign.failed_count}</span>
+                    </div>
+                  )}
                 </div>
               </CardContent>
             </Card>
@@ -30,6 +30,7 @@ export default function ChatInterface({ user }) {
   useEffect(() => {
     if (selectedConv) {
       fetchMessages(selectedConv.id);
+      markRead(selectedConv.id);
     }
   }, [selectedConv]);
 
@@ -64,6 +65,18 @@ export default function ChatInterface({ user }) {
     }
   };
 
+  const markRead = async (conversationId) => {
+    try {
+      const token = localStorage.getItem('token');
+      await axios.post(`${API}/conversations/${conversationId}/read`, null, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setConversations((convs) => convs.map((c) => (c.id === conversationId ? { ...c, unread_count: 0 } : c)));
+    } catch (error) {
+      // The badge just stays until the next refresh
+    }
+  };
+
   const sendMessage = async () => {
     if (!input.trim() || !selectedConv) return;
 
@@ -173,8 +186,13 @@ export default function ChatInterface({ user }) {
                     </div>
                     <div className="flex-1 min-w-0">
                       <p className="font-medium truncate">{conv.contact_name || 'Unknown'}</p>
-                      <p className="text-sm text-muted-foreground truncate">{conv.contact_phone}</p>
+                      <p className="text-sm text-muted-foreground truncate">{conv.last_message_preview || conv.contact_phone}</p>
                     </div>
+                    {conv.unread_count > 0 && (
+                      <span className="min-w-5 h-5 px-1.5 rounded-full bg-primary text-primary-foreground text-xs flex items-center justify-center" data-testid={`unread-${conv.id}`}>
+                        {conv.unread_count}
+                      </span>
+                    )}
                   </div>
                 </button>
               ))
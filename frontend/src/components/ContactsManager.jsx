@@ -5,7 +5,7 @@ import { Input } from '@/components/ui/input';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Dialog, DialogContent, DialogHeader, DialogTitle, DialogTrigger } from '@/components/ui/dialog';
 import { Label } from '@/components/ui/label';
-import { Users, Plus, Mail, Phone } from 'lucide-react';
+import { Users, Plus, Mail, Phone, Search } from 'lucide-react';
 import { toast } from 'sonner';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL || "";
@@ -13,6 +13,8 @@ const API = `${BACKEND_URL}/api`;
 
 export default function ContactsManager({ user }) {
   const [contacts, setContacts] = useState([]);
+  const [search, setSearch] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
   const [dialogOpen, setDialogOpen] = useState(false);
   const [formData, setFormData] = useState({
     name: '',
@@ -21,16 +23,20 @@ export default function ContactsManager({ user }) {
   });
 
   useEffect(() => {
-    fetchContacts();
-  }, []);
+    // Debounced so typing doesn't fire a request per keystroke
+    const timer = setTimeout(() => fetchContacts(), 250);
+    return () => clearTimeout(timer);
+  }, [search]);
 
-  const fetchContacts = async () => {
+  const fetchContacts = async (after = null) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/contacts`, {
+      const response = await axios.get(`${API}/contacts/search`, {
+        params: { q: search, limit: 50, ...(after ? { after } : {}) },
         headers: { Authorization: `Bearer ${token}` }
       });
-      setContacts(response.data);
+      setContacts(after ? [...contacts, ...response.data.contacts] : response.data.contacts);
+      setNextCursor(response.data.next);
     } catch (error) {
       toast.error('Failed to fetch contacts');
     }
@@ -118,13 +124,25 @@ export default function ContactsManager({ user }) {
 
       <Card>
         <CardHeader>
-          <CardTitle>All Contacts ({contacts.length})</CardTitle>
+          <div className="flex items-center justify-between gap-4">
+            <CardTitle>{search ? 'Search Results' : 'All Contacts'}</CardTitle>
+            <div className="relative w-72">
+              <Search className="w-4 h-4 absolute left-3 top-1/2 -translate-y-1/2 text-muted-foreground" />
+              <Input
+                placeholder="Search by name or phone"
+                value={search}
+                onChange={(e) => setSearch(e.target.value)}
+                className="pl-9"
+                data-testid="contact-search-input"
+              />
+            </div>
+          </div>
         </CardHeader>
         <CardContent>
           {contacts.length === 0 ? (
             <div className="flex flex-col items-center justify-center py-12">
               <Users className="w-12 h-12 text-muted-foreground mb-4" />
-              <p className="text-muted-foreground">No contacts yet</p>
+              <p className="text-muted-foreground">{search ? 'No matching contacts' : 'No contacts yet'}</p>
             </div>
           ) : (
             <div className="space-y-3">
@@ -161,6 +179,11 @@ export default function ContactsManager({ user }) {
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <Button variant="outline" className="w-full" onClick={() => fetchContacts(nextCursor)} data-testid="load-more-contacts-btn">
+                  Load more
+                </Button>
+              )}
             </div>
           )}
         </CardContent>
@@ -76,6 +76,22 @@ export default function TenantProfileSettings({ user }) {
     }
   };
 
+  const uploadLogo = async (file) => {
+    if (!file) return;
+    try {
+      const token = localStorage.getItem('token');
+      const body = new FormData();
+      body.append('file', file);
+      const response = await axios.post(`${API}/tenants/${user.tenant_id}/logo`, body, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setFormData({ ...formData, logo_url: response.data.logo_url });
+      toast.success('Logo uploaded');
+    } catch (error) {
+      toast.error(error.response?.data?.detail || 'Failed to upload logo');
+    }
+  };
+
   return (
     <div data-testid="tenant-profile-settings" className="space-y-6">
       <div>
@@ -227,7 +243,13 @@ export default function TenantProfileSettings({ user }) {
               onChange={(e) => setFormData({ ...formData, logo_url: e.target.value })}
               data-testid="logo-url-input"
             />
-            <p className="text-xs text-muted-foreground">URL to your business logo image</p>
+            <Input
+              type="file"
+              accept="image/png,image/jpeg,image/gif,image/webp"
+              onChange={(e) => uploadLogo(e.target.files[0])}
+              data-testid="logo-file-input"
+            />
+            <p className="text-xs text-muted-foreground">URL to your business logo image, or upload one</p>
           </div>
 
           <div className="space-y-2">